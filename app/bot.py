@@ -1,25 +1,400 @@
 import os
+import sys
+import html
+import random
+import sqlite3
 import asyncio
 import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+import httpx
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import CommandStart
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.filters import Command, CommandObject, CommandStart
+from aiogram.types import (
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    KeyboardButton,
+    Message,
+    ReplyKeyboardMarkup,
+    WebAppInfo,
+)
 
 # Логи, чтобы видеть, что происходит
 logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)  # без строки на каждый опрос кэша
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 WEBAPP_URL = os.getenv("WEBAPP_URL", "http://localhost:8000").strip()
+# Веб-приложение локально (не через ngrok): отсюда бот берёт уже собранные подборки
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000").strip().rstrip("/")
+# Свой адрес Bot API (локальный сервер или фейк для тестов рассылки); пусто — api.telegram.org
+BOT_API_URL = os.getenv("BOT_API_URL", "").strip()
+SUBSCRIBERS_DB = os.getenv("SUBSCRIBERS_DB", "subscribers.sqlite3")
+DIGEST_TIME = os.getenv("DIGEST_TIME", "09:00").strip()  # по Москве
 
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN пуст. Открой .env и вставь токен из @BotFather (BOT_TOKEN=...).")
 
-bot = Bot(token=BOT_TOKEN)
+# Темы бота = темы веб-приложения; команда /<ключ>
+TOPIC_TITLES = {
+    "afisha": "Афиша Москвы",
+    "series": "Сериалы",
+    "movies": "Фильмы",
+    "agro": "Агро-бизнес",
+    "svo": "Новости СВО",
+    "ai": "Новости ИИ",
+}
+CACHE_SYNC_SEC = 30   # как часто сверяемся с кэшем веб-приложения
+BOT_ITEMS = 5         # карточек в ответе на команду
+INLINE_ITEMS = 20     # карточек в инлайн-выдаче по теме
+
+# Ежедневный дайджест: дневные подборки этих тем
+MSK_TZ = timezone(timedelta(hours=3))
+DIGEST_TOPICS = ("afisha", "ai", "agro")
+# Лимиты Telegram: ~30 сообщений/с на бота и не чаще 1 сообщения/с в один чат — берём с запасом
+SEND_PER_SEC = 25
+PER_CHAT_INTERVAL = 1.1
+SEND_WORKERS = 8
+SEND_RETRIES = 5
+MESSAGE_LIMIT = 4096
+# Пул темы не сегодняшний (МСК) — перед рассылкой просим веб-приложение собрать его заново
+DIGEST_REFRESH_TIMEOUT = 120
+# BadRequest, после которых в чат уже не написать; остальные (разметка, длина) — наша ошибка, подписку не трогаем
+GONE_CHAT_ERRORS = ("chat not found", "user is deactivated", "peer_id_invalid")
+
+# Готовые ответы по темам, пересобираются только при смене версии пула:
+# topic -> {"version", "etag", "ts", "text", "inline": [InlineQueryResultArticle]}
+RENDERED: Dict[str, Dict[str, Any]] = {}
+# Инлайн-меню по всем темам (пустой запрос)
+INLINE_MENU: List[InlineQueryResultArticle] = []
+
+session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)) if BOT_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
 dp = Dispatcher()
 
+
+class SubscriberStore:
+    """Подписчики дайджеста: chat_id в SQLite (переживает перезапуск бота)."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, since INTEGER NOT NULL)")
+        self.db.commit()
+
+    def add(self, chat_id: int) -> bool:
+        with self.db:
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO subscribers(chat_id, since) VALUES (?, strftime('%s','now'))", (chat_id,)
+            )
+        return cur.rowcount > 0
+
+    def remove(self, chat_id: int) -> bool:
+        with self.db:
+            cur = self.db.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+        return cur.rowcount > 0
+
+    def all(self) -> List[int]:
+        return [row[0] for row in self.db.execute("SELECT chat_id FROM subscribers ORDER BY chat_id")]
+
+
+SUBSCRIBERS = SubscriberStore(SUBSCRIBERS_DB)
+
+
+class RateLimiter:
+    """Не чаще per_sec отправок в секунду на всего бота; pause() — общий стоп после flood wait."""
+
+    def __init__(self, per_sec: float):
+        self.interval = 1.0 / per_sec
+        self.next_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            if self.next_at > now:
+                await asyncio.sleep(self.next_at - now)
+            self.next_at = max(now, self.next_at) + self.interval
+
+    def pause(self, seconds: float):
+        self.next_at = max(self.next_at, asyncio.get_running_loop().time() + seconds)
+
+
+class Broadcaster:
+    """Рассылка одного готового дайджеста всем подписчикам.
+
+    Очередь (chat_id, части, попытка) разбирают SEND_WORKERS воркеров; общий темп — RateLimiter,
+    части одному чату идут с паузой PER_CHAT_INTERVAL. RetryAfter — ждём сколько сказали,
+    сетевые/5xx — повтор с экспоненциальной паузой, заблокировали бота или чата больше нет —
+    отписываем. Прочие BadRequest — сбой доставки, подписчик остаётся.
+    """
+
+    def __init__(self, bot: Bot, store: SubscriberStore):
+        self.bot = bot
+        self.store = store
+        self.limiter = RateLimiter(SEND_PER_SEC)
+        self._requeues: set = set()  # отложенные повторы (держим ссылки, чтобы задачи не собрал GC)
+
+    async def send(self, parts: List[str], chat_ids: List[int]) -> Dict[str, int]:
+        stats = {"sent": 0, "failed": 0, "unsubscribed": 0}
+        queue: asyncio.Queue[Tuple[int, int, int]] = asyncio.Queue()  # chat_id, с какой части, попытка
+        for chat_id in chat_ids:
+            queue.put_nowait((chat_id, 0, 0))
+        workers = [asyncio.create_task(self._worker(queue, parts, stats)) for _ in range(SEND_WORKERS)]
+        await queue.join()
+        for w in workers:
+            w.cancel()
+        return stats
+
+    async def _worker(self, queue: asyncio.Queue, parts: List[str], stats: Dict[str, int]):
+        while True:
+            chat_id, start, attempt = await queue.get()
+            try:
+                retry = await self._deliver(chat_id, start, attempt, parts, stats)
+            except Exception:
+                logging.exception(f"Дайджест: сбой отправки в {chat_id}")
+                retry = None
+                stats["failed"] += 1
+            if retry is None:
+                queue.task_done()
+            elif attempt + 1 >= SEND_RETRIES:
+                logging.warning(f"Дайджест: {chat_id} — не доставлено за {SEND_RETRIES} попыток")
+                stats["failed"] += 1
+                queue.task_done()
+            else:
+                part, delay = retry
+                task = asyncio.create_task(self._requeue(queue, (chat_id, part, attempt + 1), delay))
+                self._requeues.add(task)
+                task.add_done_callback(self._requeues.discard)
+
+    @staticmethod
+    async def _requeue(queue: asyncio.Queue, job: Tuple[int, int, int], delay: float):
+        # исходная задача «не выполнена», пока повтор не встал в очередь — join() его дождётся
+        await asyncio.sleep(delay)
+        queue.put_nowait(job)
+        queue.task_done()
+
+    async def _deliver(self, chat_id: int, start: int, attempt: int, parts: List[str],
+                       stats: Dict[str, int]) -> Tuple[int, float] | None:
+        """Шлём части с start; вернёт (часть, пауза), если надо повторить позже."""
+        for i in range(start, len(parts)):
+            if i > start:
+                await asyncio.sleep(PER_CHAT_INTERVAL)
+            await self.limiter.wait()
+            try:
+                await self.bot.send_message(chat_id, parts[i], parse_mode="HTML", disable_web_page_preview=True)
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+                return i, float(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                if isinstance(e, TelegramBadRequest) and not any(m in e.message.lower() for m in GONE_CHAT_ERRORS):
+                    logging.warning(f"Дайджест: {chat_id} — {e.message}, подписку не трогаю")
+                    stats["failed"] += 1
+                    return None
+                # бот заблокирован / чат удалён — больше не шлём
+                logging.info(f"Дайджест: {chat_id} недоступен ({e.message}), отписываю")
+                self.store.remove(chat_id)
+                stats["unsubscribed"] += 1
+                return None
+            except (TelegramNetworkError, TelegramServerError):
+                return i, 2 ** attempt + random.random()
+        stats["sent"] += 1
+        return None
+
+
+def render_text(topic: str, items: List[Dict[str, Any]]) -> str:
+    lines = [f"<b>{html.escape(TOPIC_TITLES[topic])}</b>"]
+    for it in items[:BOT_ITEMS]:
+        title = html.escape(it.get("title") or "")
+        url = it.get("url") or ""
+        lines.append(f"• <a href=\"{html.escape(url, quote=True)}\">{title}</a>" if url else f"• {title}")
+    return "\n\n".join(lines)
+
+
+def render_inline(topic: str, version: str, items: List[Dict[str, Any]]) -> List[InlineQueryResultArticle]:
+    out = []
+    for i, it in enumerate(items[:INLINE_ITEMS]):
+        title = it.get("title") or ""
+        url = it.get("url") or ""
+        text = f"<b>{html.escape(title)}</b>"
+        if url:
+            text += f"\n{html.escape(url)}"
+        out.append(InlineQueryResultArticle(
+            id=f"{topic}:{version}:{i}"[:64],
+            title=title[:120] or TOPIC_TITLES[topic],
+            description=(it.get("summary") or "")[:200] or None,
+            url=url or None,
+            thumbnail_url=it.get("image") or None,
+            input_message_content=InputTextMessageContent(message_text=text, parse_mode="HTML"),
+        ))
+    return out
+
+
+def rebuild_menu():
+    menu = []
+    for topic, title in TOPIC_TITLES.items():
+        rec = RENDERED.get(topic)
+        if not rec or not rec["inline"]:
+            continue
+        menu.append(InlineQueryResultArticle(
+            id=f"menu:{topic}:{rec['version']}"[:64],
+            title=title,
+            description=f"Свежее: {rec['inline'][0].title}"[:200],
+            input_message_content=InputTextMessageContent(message_text=rec["text"], parse_mode="HTML"),
+        ))
+    INLINE_MENU[:] = menu
+
+
+async def sync_topics(client: httpx.AsyncClient):
+    """Один проход по кэшу веб-приложения: новые версии пулов -> новые готовые ответы."""
+    changed = False
+    for topic in TOPIC_TITLES:
+        rec = RENDERED.get(topic)
+        headers = {"If-None-Match": rec["etag"]} if rec and rec.get("etag") else {}
+        try:
+            r = await client.get(f"{API_URL}/cache/{topic}", headers=headers)
+        except Exception as e:
+            logging.warning(f"Кэш веб-приложения недоступен: {e!r}")
+            return
+        if r.status_code != 200:
+            continue
+        js = r.json()
+        items, version = js.get("items") or [], js.get("version") or ""
+        if not version or not items:
+            continue
+        RENDERED[topic] = {
+            "version": version,
+            "etag": r.headers.get("ETag", ""),
+            "ts": js.get("ts") or 0,  # когда веб-приложение собрало пул
+            "text": render_text(topic, items),
+            "inline": render_inline(topic, version, items),
+        }
+        changed = True
+    if changed:
+        rebuild_menu()
+
+
+async def sync_loop():
+    async with httpx.AsyncClient(timeout=10) as client:
+        while True:
+            await sync_topics(client)
+            await asyncio.sleep(CACHE_SYNC_SEC)
+
+
+def pack_messages(blocks: List[str], sep: str = "\n\n") -> List[str]:
+    """Склеиваем блоки в сообщения не длиннее MESSAGE_LIMIT.
+
+    Блок длиннее лимита режем по строкам (каждая строка — целый HTML-элемент, разметку не рвём);
+    строку длиннее лимита целиком пропускаем.
+    """
+    parts: List[str] = []
+    current = ""
+    for block in blocks:
+        for piece in [block] if len(block) <= MESSAGE_LIMIT else block.split(sep):
+            if len(piece) > MESSAGE_LIMIT:
+                logging.warning(f"Дайджест: строка длиннее {MESSAGE_LIMIT} символов пропущена")
+                continue
+            if current and len(current) + len(sep) + len(piece) > MESSAGE_LIMIT:
+                parts.append(current)
+                current = piece
+            else:
+                current = f"{current}{sep}{piece}" if current else piece
+    if current:
+        parts.append(current)
+    return parts
+
+
+def is_today(ts: int) -> bool:
+    return bool(ts) and datetime.fromtimestamp(ts, MSK_TZ).date() == datetime.now(MSK_TZ).date()
+
+
+async def refresh_digest_topics(client: httpx.AsyncClient):
+    """Веб-приложение само по расписанию не обновляется (только прогрев и тапы в /data),
+    поэтому после тихой ночи в кэше вчерашние пулы во вчерашнем порядке. Такие темы
+    пересобираем через /data?force=1 — это не инлайн-путь, скрейп здесь допустим.
+    """
+    await sync_topics(client)
+    stale = [t for t in DIGEST_TOPICS if not is_today(RENDERED.get(t, {}).get("ts", 0))]
+    for topic in stale:
+        try:
+            r = await client.get(f"{API_URL}/data", params={"topic": topic, "force": 1})
+            r.raise_for_status()
+        except Exception as e:
+            logging.warning(f"Дайджест: не удалось обновить {topic}: {e!r}")
+    if stale:
+        await sync_topics(client)
+
+
+def render_digest() -> List[str]:
+    """Дайджест из готовых рендеров тем — один раз на всю рассылку; каждая часть влезает в сообщение.
+
+    Темы, чей пул не сегодняшний, пропускаем: вчерашняя подборка под сегодняшней датой хуже пропуска.
+    """
+    blocks = []
+    for topic in DIGEST_TOPICS:
+        rec = RENDERED.get(topic)
+        if rec is None or not is_today(rec.get("ts", 0)):
+            logging.warning(f"Дайджест: подборка {topic} не сегодняшняя, пропускаю")
+            continue
+        blocks.append(rec["text"])
+    if not blocks:
+        return []
+    return pack_messages([f"<b>Подборка на {datetime.now(MSK_TZ):%d.%m}</b>", *blocks])
+
+
+async def broadcast_digest():
+    async with httpx.AsyncClient(timeout=DIGEST_REFRESH_TIMEOUT) as client:
+        await refresh_digest_topics(client)
+    parts = render_digest()
+    if not parts:
+        logging.warning("Дайджест: подборки ещё не в кэше, рассылку пропускаю")
+        return
+    chat_ids = SUBSCRIBERS.all()
+    stats = await Broadcaster(bot, SUBSCRIBERS).send(parts, chat_ids)
+    logging.info(f"Дайджест разослан: {stats} (подписчиков {len(chat_ids)})")
+
+
+def seconds_until(hhmm: str) -> float:
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    now = datetime.now(MSK_TZ)
+    at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if at <= now:
+        at += timedelta(days=1)
+    return (at - now).total_seconds()
+
+
+async def digest_loop():
+    while True:
+        await asyncio.sleep(seconds_until(DIGEST_TIME))
+        try:
+            await broadcast_digest()
+        except Exception:
+            logging.exception("Дайджест: рассылка упала")
+
+
+def find_topic(query: str) -> str | None:
+    q = (query or "").strip().lower()
+    if not q:
+        return None
+    for topic, title in TOPIC_TITLES.items():
+        if topic.startswith(q) or title.lower().startswith(q) or q in title.lower():
+            return topic
+    return None
+
+
 @dp.message(CommandStart())
 async def cmd_start(m: Message):
     logging.info(f"/start от @{m.from_user.username} (id={m.from_user.id})")
@@ -31,6 +406,39 @@ async def cmd_start(m: Message):
     )
     await m.answer("Привет! Нажми кнопку, чтобы открыть мини‑приложение.", reply_markup=kb)
 
+@dp.message(Command("topics"))
+async def cmd_topics(m: Message):
+    await m.answer("\n".join(f"/{topic} — {title}" for topic, title in TOPIC_TITLES.items()))
+
+@dp.message(Command("subscribe"))
+async def cmd_subscribe(m: Message):
+    if SUBSCRIBERS.add(m.chat.id):
+        await m.answer(f"Готово! Дайджест будет приходить каждый день в {DIGEST_TIME} (МСК). /unsubscribe — отписаться.")
+    else:
+        await m.answer("Вы уже подписаны на дайджест.")
+
+@dp.message(Command("unsubscribe"))
+async def cmd_unsubscribe(m: Message):
+    if SUBSCRIBERS.remove(m.chat.id):
+        await m.answer("Отписал от дайджеста.")
+    else:
+        await m.answer("Вы и не были подписаны. /subscribe — подписаться.")
+
+# /afisha, /ai, … — ответ из готового рендера, в сеть не ходим
+@dp.message(Command(*TOPIC_TITLES))
+async def cmd_topic(m: Message, command: CommandObject):
+    rec = RENDERED.get(command.command.lower())
+    if not rec:
+        await m.answer("Подборка ещё собирается, попробуйте через минуту.")
+        return
+    await m.answer(rec["text"], parse_mode="HTML", disable_web_page_preview=True)
+
+@dp.inline_query()
+async def inline_topics(q: InlineQuery):
+    topic = find_topic(q.query)
+    results = RENDERED[topic]["inline"] if topic in RENDERED else INLINE_MENU
+    await q.answer(results, cache_time=CACHE_SYNC_SEC, is_personal=False)
+
 # Просто чтобы видеть, что сообщения доходят
 @dp.message(F.text)
 async def echo(m: Message):
@@ -40,8 +448,20 @@ async def echo(m: Message):
 async def main():
     # На всякий случай снимаем вебхук, чтобы polling точно работал
     await bot.delete_webhook(drop_pending_updates=True)
+    tasks = [asyncio.create_task(sync_loop()), asyncio.create_task(digest_loop())]
     logging.info("Запускаю polling…")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        for t in tasks:
+            t.cancel()
+
+async def digest_now():
+    """`python bot.py digest` — разослать дайджест сейчас (удобно против фейкового BOT_API_URL)."""
+    try:
+        await broadcast_digest()
+    finally:
+        await bot.session.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(digest_now() if sys.argv[1:] == ["digest"] else main())
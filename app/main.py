@@ -2,17 +2,34 @@
 from __future__ import annotations
 
 import os
+import re
 import time
 import html
+import gzip
+import heapq
+import codecs
+import asyncio
+import hashlib
+import logging
+import itertools
+import mimetypes
 import random
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlparse, urljoin
 
 import httpx
 from bs4 import BeautifulSoup
 from fastapi import FastAPI, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 
 # === чтобы TMDB_API_KEY подтянулся из .env ===
 try:
@@ -21,6 +38,14 @@ try:
 except Exception:
     pass
 
+# brotli — необязательный модуль: без него отдаём только gzip
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+log = logging.getLogger("news")
+
 APP_TITLE = "Моя подборка"
 MSK_TZ = timezone(timedelta(hours=3))
 # ВРЕМЯ ЖИЗНИ КЭША ДЛЯ КАЖДОЙ ТЕМЫ
@@ -35,8 +60,111 @@ TOPIC_TTL = {
     "ai":     60 * 60,       # 1 час
 }
 
+# Границы адаптивного интервала (мин, макс): TOPIC_TTL — только стартовое значение
+TOPIC_TTL_BOUNDS = {
+    "afisha": (30 * 60, 6 * 60 * 60),
+    "series": (6 * 60 * 60, 3 * 24 * 60 * 60),
+    "movies": (6 * 60 * 60, 3 * 24 * 60 * 60),
+    "agro":   (30 * 60, 6 * 60 * 60),
+    "svo":    (2 * 60, 30 * 60),
+    "ai":     (20 * 60, 4 * 60 * 60),
+}
+
+
+class RefreshScheduler:
+    """Интервалы обновления источников, выученные по тому, как часто они меняются.
+
+    - сайты/API: сравниваем хэш содержимого — не изменилось -> интервал растёт, изменилось -> падает;
+    - Telegram: оцениваем частоту публикаций по ts постов и обновляемся,
+      когда ожидается ~TARGET_NEW новых постов.
+    Каждый источник перекачивается не чаще своего интервала (run_pipeline берёт прошлый результат);
+    интервал темы = минимальный среди её источников, в рамках TOPIC_TTL_BOUNDS, — это TTL кэша темы.
+    """
+
+    GROW = 1.5
+    SHRINK = 0.5
+    TARGET_NEW = 3
+    ALPHA = 0.3  # вес нового наблюдения в скользящей оценке частоты
+
+    def __init__(self):
+        self.sources: Dict[str, Dict[str, Any]] = {}
+
+    def _src(self, topic: str, source: str) -> Dict[str, Any]:
+        key = f"{topic}:{source}"
+        st = self.sources.get(key)
+        if st is None:
+            st = self.sources[key] = {
+                "topic": topic,
+                "interval": float(TOPIC_TTL.get(topic, DEFAULT_TTL)),
+                "hash": None,
+                "rate": None,  # постов в секунду
+                "checked": 0,
+            }
+        return st
+
+    def _clamp(self, topic: str, value: float) -> float:
+        lo, hi = TOPIC_TTL_BOUNDS.get(topic, (DEFAULT_TTL, DEFAULT_TTL))
+        return min(hi, max(lo, value))
+
+    def observe_content(self, topic: str, source: str, payload: Any):
+        """Сайт/API ответил: сравниваем с прошлым содержимым."""
+        digest = hashlib.sha1(repr(payload).encode("utf-8")).hexdigest()
+        st = self._src(topic, source)
+        if st["hash"] is not None:
+            factor = self.SHRINK if digest != st["hash"] else self.GROW
+            st["interval"] = self._clamp(topic, st["interval"] * factor)
+        st["hash"] = digest
+        st["checked"] = now_ts()
+
+    def observe_posts(self, topic: str, source: str, new_ts: List[int]):
+        """Канал ответил: new_ts — время публикации постов, которых раньше не видели."""
+        st = self._src(topic, source)
+        now = now_ts()
+        stamps = sorted(t for t in new_ts if t)
+        if not st["checked"]:
+            # первый заход: целая страница истории, частота — по разбросу дат
+            if len(stamps) >= 2 and stamps[-1] > stamps[0]:
+                st["rate"] = (len(stamps) - 1) / (stamps[-1] - stamps[0])
+        else:
+            observed = len(new_ts) / max(1, now - st["checked"])
+            st["rate"] = observed if st["rate"] is None else (
+                self.ALPHA * observed + (1 - self.ALPHA) * st["rate"]
+            )
+        st["checked"] = now
+        if st["rate"] is not None:
+            hi = TOPIC_TTL_BOUNDS.get(topic, (DEFAULT_TTL, DEFAULT_TTL))[1]
+            st["interval"] = self._clamp(topic, self.TARGET_NEW / st["rate"] if st["rate"] > 0 else hi)
+
+    def source_interval(self, topic: str, source: str) -> float:
+        return self._src(topic, source)["interval"]
+
+    def topic_interval(self, topic: str) -> int:
+        intervals = [st["interval"] for st in self.sources.values() if st["topic"] == topic]
+        if not intervals:
+            return TOPIC_TTL.get(topic, DEFAULT_TTL)
+        return int(min(intervals))
+
+
+SCHEDULER = RefreshScheduler()
+
 def get_ttl(topic: str) -> int:
-    return TOPIC_TTL.get(topic, DEFAULT_TTL)
+    return SCHEDULER.topic_interval(topic)
+
+# Сколько карточек отдаём за раз; в кэше лежит весь отфильтрованный пул темы
+DEFAULT_PAGE_SIZE = 10
+TOPIC_PAGE_SIZE = {
+    "afisha": 10,
+    "series": 5,
+    "movies": 5,
+    "agro":   10,
+    "svo":    10,
+    "ai":     10,
+}
+MAX_PAGE_SIZE = 50
+
+# Прогрев всех тем в фоне при старте (PREWARM=0 — выключить)
+PREWARM = os.getenv("PREWARM", "1").strip() != "0"
+TMDB_POOL_PAGES = 3  # страниц TMDB в пул
 
 HEADERS = {
     "User-Agent": (
@@ -49,27 +177,84 @@ HEADERS = {
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY", "").strip()  # TMDB v3 API key
 
-# Фиксированные картинки тем (одна на тему)
+# Страницы-источники ссылок качаем потоково: не больше N байт и до первых MAX_ANCHORS ссылок
+MAX_ANCHORS = 120
+DEFAULT_MAX_BYTES = 512 * 1024  # 512 КБ по умолчанию
+SOURCE_MAX_BYTES = {
+    # тяжёлые страницы: нужные ссылки в первой части разметки, хвост — скрипты и JSON
+    "techcrunch.com": 768 * 1024,
+    "www.theverge.com": 768 * 1024,
+    "venturebeat.com": 768 * 1024,
+}
+
+# Фиксированные картинки тем (одна на тему); ширину подставляет thumb_url() под srcset
 TOPIC_IMAGES = {
-    "afisha": "https://images.unsplash.com/photo-1514525253161-7a46d19cd819?q=80&w=1200&auto=format&fit=crop",
-    "series": "https://images.unsplash.com/photo-1585951237318-9ea5e175b891?q=80&w=1200&auto=format&fit=crop",
-    "movies": "https://images.unsplash.com/photo-1489599849927-2ee91cede3ba?q=80&w=1200&auto=format&fit=crop",
-    "agro": "https://images.unsplash.com/photo-1464226184884-fa280b87c399?q=80&w=1200&auto=format&fit=crop",
-    "svo": "https://images.unsplash.com/photo-1500530855697-b586d89ba3ee?q=80&w=1200&auto=format&fit=crop",  # нейтральный пейзаж
-    "ai": "https://images.unsplash.com/photo-1518770660439-4636190af475?q=80&w=1200&auto=format&fit=crop",
+    "afisha": "https://images.unsplash.com/photo-1514525253161-7a46d19cd819?q=80&auto=format&fit=crop",
+    "series": "https://images.unsplash.com/photo-1585951237318-9ea5e175b891?q=80&auto=format&fit=crop",
+    "movies": "https://images.unsplash.com/photo-1489599849927-2ee91cede3ba?q=80&auto=format&fit=crop",
+    "agro": "https://images.unsplash.com/photo-1464226184884-fa280b87c399?q=80&auto=format&fit=crop",
+    "svo": "https://images.unsplash.com/photo-1500530855697-b586d89ba3ee?q=80&auto=format&fit=crop",  # нейтральный пейзаж
+    "ai": "https://images.unsplash.com/photo-1518770660439-4636190af475?q=80&auto=format&fit=crop",
+}
+
+THUMB_WIDTHS = (400, 800, 1200)
+THUMB_RATIO = 3 / 8  # высота/ширина превью темы: карточка 150px в высоту, режем сразу на CDN
+
+# Статика: /static/<файл>?v=<хэш содержимого> кэшируется навсегда, без хэша — с ревалидацией по ETag
+STATIC_DIR = "static"
+STATIC_IMMUTABLE = "public, max-age=31536000, immutable"
+STATIC_REVALIDATE = "no-cache"
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/css", "text/plain", "text/javascript", "application/javascript",
+    "application/json", "application/manifest+json", "image/svg+xml",
 }
+COMPRESS_MIN_BYTES = 256
 
 # Telegram-каналы (без @ / t.me/)
 SVO_TELEGRAM = ["bloodysx", "bbbreaking", "Alexey_Pivo_varov", "mash"]
 AFISHA_TELEGRAM = ["sysoevfm", "instafoodpassion"]
 AGRO_TELEGRAM = ["svoe_fermerstvo", "agro_nomika", "agroinvestor", "mcxae", "mcx_ru"]
 
+# Сколько последних постов держим на канал (кольцевой буфер)
+TG_RING_SIZE = 60
+# Страница ?after= с таким числом постов почти полная (t.me отдаёт ~20) — за ней наверняка есть ещё
+TG_PAGE_FULL = 15
+
+# Вежливость к хостам: (запросов в секунду, всплеск, одновременных запросов)
+HOST_LIMITS = {
+    "t.me": (1.0, 3, 2),
+    "www.afisha.ru": (0.5, 2, 1),
+    "kudago.com": (2.0, 4, 2),
+    "api.themoviedb.org": (4.0, 8, 4),
+}
+DEFAULT_HOST_LIMIT = (2.0, 4, 2)
+RETRY_AFTER_DEFAULT = 5   # 429/503 без Retry-After — пауза по хосту, сек
+RETRY_AFTER_MAX = 30      # дольше внутри запроса не ждём: отдаём None, хост остаётся на паузе
+
+# Приоритет исходящих запросов (меньше — раньше): force=1 от пользователя впереди фонового обновления
+PRIORITY_USER = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BACKGROUND = 2
+FETCH_PRIORITY: ContextVar[int] = ContextVar("fetch_priority", default=PRIORITY_DEFAULT)
+
+# Хеджирование медленных хостов: не ответил за p95 своих задержек — шлём второй запрос
+# хост -> стартовый порог, сек: замеры живут только в памяти, а эти сайты качаются раз в 30 мин–6 ч,
+# так что после перезапуска свои 10 замеров копятся часами — до тех пор хеджируем по этому порогу
+HEDGE_HOSTS = {"mcx.gov.ru": 4.0, "www.agroxxi.ru": 3.0}
+HEDGE_SAMPLES = 100       # окно наблюдений задержки на хост
+HEDGE_MIN_SAMPLES = 10    # пока меньше — порог из HEDGE_HOSTS (для прочих хостов — не хеджируем)
+HEDGE_BUDGET_RATIO = 0.1  # не больше ~10% дополнительных запросов от общего числа
+HEDGE_MAX_INFLIGHT = 4    # и не больше 4 одновременных дублей
+
+# Трассировка: TRACE=1 — пишем таймлайн каждого обновления; /data?debug=1 — только этого запроса
+TRACE_ENABLED = os.getenv("TRACE", "0").strip() == "1"
+TRACE_BUFFER = 50  # сколько последних трейсов держим в памяти
+
 # Кэш в памяти
 CACHE: Dict[str, Dict[str, Any]] = {}
 
 app = FastAPI(title=APP_TITLE)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
 # Убираем браузерное предупреждение ngrok
 @app.middleware("http")
 async def add_skip_warning_header(request: Request, call_next):
@@ -97,42 +282,461 @@ def cache_get(topic: str) -> List[Dict[str, Any]] | None:
     return rec.get("items") or None
 
 
-def cache_set(topic: str, items: List[Dict[str, Any]]):
+def cache_set(topic: str, items: List[Dict[str, Any]]) -> str:
+    """Кладём пул темы; прошлый пул держим рядом, чтобы не ломать уже выданные курсоры."""
+    prev = CACHE.get(topic)
+    ts = now_ts()
+    version = f"{ts:x}"
+    if prev and prev.get("version") == version:  # два обновления за секунду
+        version = f"{ts:x}-{len(items)}"
     CACHE[topic] = {
-        "ts": now_ts(),
+        "ts": ts,
         "ttl": get_ttl(topic),
         "items": items,
+        "version": version,
+        "prev": (prev["version"], prev["items"]) if prev else None,
     }
+    return version
+
+
+def cache_pool(topic: str, version: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Пул по версии из курсора: текущий, предыдущий или (если устарел совсем) текущий.
+
+    Вернувшаяся версия не равна запрошенной — курсор устарел, его смещение к этому пулу не относится.
+    """
+    rec = CACHE.get(topic) or {}
+    prev = rec.get("prev")
+    if prev and prev[0] == version and rec.get("version") != version:
+        return prev
+    return rec.get("version", ""), rec.get("items") or []
+
+
+def make_cursor(version: str, offset: int) -> str:
+    return f"{version}:{offset}"
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    version, _, offset = (cursor or "").rpartition(":")
+    return version, int(offset) if offset.isdigit() else 0
 
 def short(txt: str, limit: int = 240) -> str:
     t = " ".join((txt or "").split())
     return t if len(t) <= limit else t[: limit - 1].rstrip() + "…"
 
-async def fetch_json(client: httpx.AsyncClient, url: str, **params) -> Dict[str, Any] | None:
+# ----------------------- ТРАССИРОВКА -----------------------
+TRACES: deque = deque(maxlen=TRACE_BUFFER)
+CURRENT_TRACE: ContextVar[Dict[str, Any] | None] = ContextVar("current_trace", default=None)
+_trace_ids = itertools.count(1)
+
+def start_trace(kind: str, **attrs) -> Dict[str, Any]:
+    """Новый трейс становится текущим для этой задачи и всех задач, созданных из неё."""
+    trace = {"id": next(_trace_ids), "kind": kind, "ts": now_ts(), **attrs, "spans": [], "_t0": time.perf_counter()}
+    CURRENT_TRACE.set(trace)
+    return trace
+
+def finish_trace(trace: Dict[str, Any]) -> Dict[str, Any]:
+    trace["total_ms"] = round((time.perf_counter() - trace.pop("_t0")) * 1000, 1)
+    trace["spans"].sort(key=lambda sp: sp["start_ms"])
+    TRACES.append(trace)
+    return trace
+
+def trace_event(name: str, started: float, ended: float, **attrs):
+    """Отрезок [started, ended] (perf_counter) в текущий трейс; без трейса — ничего."""
+    trace = CURRENT_TRACE.get()
+    if trace is not None and "_t0" in trace:
+        trace["spans"].append({
+            "name": name,
+            "start_ms": round((started - trace["_t0"]) * 1000, 1),
+            "ms": round((ended - started) * 1000, 1),
+            **attrs,
+        })
+
+@contextmanager
+def span(name: str, **attrs):
+    if CURRENT_TRACE.get() is None:  # трассировка выключена — только одна проверка
+        yield
+        return
+    started = time.perf_counter()
     try:
-        r = await client.get(url, params=params, headers=HEADERS, timeout=20)
-        if r.status_code == 200:
-            return r.json()
-    except Exception:
-        pass
+        yield
+    finally:
+        trace_event(name, started, time.perf_counter(), **attrs)
+
+def render_waterfall(trace: Dict[str, Any], width: int = 60) -> str:
+    """Текстовый водопад трейса: старт, длительность, полоска, имя."""
+    total = max(trace.get("total_ms") or 0, 1)
+    lines = [f"#{trace['id']} {trace['kind']} {trace.get('topic', '')} — {trace.get('total_ms')} мс"]
+    for sp in trace["spans"]:
+        left = int(sp["start_ms"] / total * width)
+        bar = " " * left + "█" * max(1, int(sp["ms"] / total * width))
+        extra = " ".join(f"{k}={v}" for k, v in sp.items() if k not in ("name", "start_ms", "ms"))
+        lines.append(f"{sp['start_ms']:>8.1f} {sp['ms']:>8.1f}  {bar:<{width + 1}} {sp['name']} {extra}".rstrip())
+    return "\n".join(lines)
+
+
+class _HostBucket:
+    """Состояние одного хоста: токены, занятые слоты, очередь ожидающих, пауза по Retry-After."""
+
+    def __init__(self, rate: float, burst: int, concurrency: int):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.cooldown_until = 0.0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class OutboundScheduler:
+    """Единая точка для исходящих запросов: token bucket и лимит параллельности на хост,
+    пауза по Retry-After, очередь по приоритету (FETCH_PRIORITY)."""
+
+    def __init__(self, limits: Dict[str, Tuple[float, int, int]], default: Tuple[float, int, int]):
+        self.limits = limits
+        self.default = default
+        self.hosts: Dict[str, _HostBucket] = {}
+        self._seq = itertools.count()
+
+    def _bucket(self, host: str) -> _HostBucket:
+        b = self.hosts.get(host)
+        if b is None:
+            b = self.hosts[host] = _HostBucket(*self.limits.get(host, self.default))
+        return b
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        b = self._bucket(urlparse(url).netloc)
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(b.waiters, (FETCH_PRIORITY.get(), next(self._seq), fut))
+        self._pump(b)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():  # слот успели выдать — вернуть
+                self._release(b)
+            raise
+        try:
+            yield
+        finally:
+            self._release(b)
+
+    def _release(self, b: _HostBucket):
+        b.active -= 1
+        self._pump(b)
+
+    def _wake(self, b: _HostBucket):
+        b.timer = None
+        self._pump(b)
+
+    def _pump(self, b: _HostBucket):
+        while b.waiters:
+            fut = b.waiters[0][2]
+            if fut.done():  # ожидающий отменён
+                heapq.heappop(b.waiters)
+                continue
+            if b.active >= b.concurrency:
+                return
+            now = time.monotonic()
+            b.tokens = min(b.burst, b.tokens + (now - b.stamp) * b.rate)
+            b.stamp = now
+            wait = max(b.cooldown_until - now, (1 - b.tokens) / b.rate if b.tokens < 1 else 0.0)
+            if wait > 0:
+                if b.timer is None:
+                    b.timer = asyncio.get_running_loop().call_later(wait, self._wake, b)
+                return
+            heapq.heappop(b.waiters)
+            b.tokens -= 1
+            b.active += 1
+            fut.set_result(None)
+
+    def backoff(self, url: str, r: httpx.Response) -> float | None:
+        """429/503 -> ставим хост на паузу. Возвращает паузу в секундах (None — не про лимиты)."""
+        if r.status_code not in (429, 503):
+            return None
+        delay = float(RETRY_AFTER_DEFAULT)
+        raw = (r.headers.get("Retry-After") or "").strip()
+        if raw.isdigit():
+            delay = float(raw)
+        elif raw:
+            try:
+                delay = max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+            except Exception:
+                pass
+        host = urlparse(url).netloc
+        b = self._bucket(host)
+        b.cooldown_until = max(b.cooldown_until, time.monotonic() + delay)
+        log.warning("%s ответил %s, пауза %.0f с", host, r.status_code, delay)
+        return delay
+
+
+OUTBOUND = OutboundScheduler(HOST_LIMITS, DEFAULT_HOST_LIMIT)
+
+
+class Hedger:
+    """Порог хеджирования по хосту (p95 наблюдённых задержек) и общий бюджет дублей."""
+
+    def __init__(self):
+        self.samples: Dict[str, deque] = {}
+        self.credits = 0.0
+        self.inflight = 0
+
+    def observe(self, url: str, seconds: float):
+        host = urlparse(url).netloc
+        ring = self.samples.get(host)
+        if ring is None:
+            ring = self.samples[host] = deque(maxlen=HEDGE_SAMPLES)
+        ring.append(seconds)
+
+    def threshold(self, url: str) -> float | None:
+        host = urlparse(url).netloc
+        ring = self.samples.get(host)
+        if not ring or len(ring) < HEDGE_MIN_SAMPLES:
+            return HEDGE_HOSTS.get(host)
+        ordered = sorted(ring)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def earn(self):
+        # каждый запрос приносит долю дубля; копим не больше чем на HEDGE_MAX_INFLIGHT
+        self.credits = min(float(HEDGE_MAX_INFLIGHT), self.credits + HEDGE_BUDGET_RATIO)
+
+    def try_spend(self) -> bool:
+        if self.inflight >= HEDGE_MAX_INFLIGHT or self.credits < 1:
+            return False
+        self.credits -= 1
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+
+
+HEDGER = Hedger()
+
+async def _attempt(client: httpx.AsyncClient, url: str, reader, params: Dict[str, Any] | None = None,
+                   granted: asyncio.Event | None = None):
+    """Одна попытка GET через OUTBOUND; reader(response) читает тело (только при 200).
+
+    После 429/503 ждём Retry-After (если он не длиннее RETRY_AFTER_MAX) и пробуем ещё раз.
+    granted взводится, когда OUTBOUND выдал слот (с этого момента считает время хедж).
+    """
+    host = urlparse(url).netloc
+    for attempt in range(2):
+        queued = time.perf_counter()
+        async with OUTBOUND.slot(url):
+            started = time.perf_counter()
+            if granted is not None:
+                granted.set()
+            trace_event("queue", queued, started, host=host)
+            status = 0
+            try:
+                async with client.stream("GET", url, params=params, headers=HEADERS, timeout=20) as r:
+                    status = r.status_code
+                    if r.status_code == 200:
+                        result = await reader(r)
+                        HEDGER.observe(url, time.perf_counter() - started)
+                        return result
+                    delay = OUTBOUND.backoff(url, r)
+            except Exception:
+                return None
+            finally:
+                trace_event("fetch", started, time.perf_counter(), url=url, status=status)
+        if attempt or delay is None or delay > RETRY_AFTER_MAX:
+            return None
     return None
 
-async def fetch_html(client: httpx.AsyncClient, url: str) -> str | None:
+async def _get(
+    client: httpx.AsyncClient, url: str, reader, params: Dict[str, Any] | None = None, hedge: bool | None = None
+):
+    """GET с опциональным хеджированием (hedge=None — по списку HEDGE_HOSTS).
+
+    Если первая попытка не уложилась в p95 хоста и бюджет позволяет, запускаем вторую
+    и берём первый успешный ответ; проигравшую попытку отменяем.
+    p95 меряется от выдачи слота, поэтому и часы хеджа запускаем с неё, а не с постановки
+    в очередь хоста: иначе при занятой очереди дубль просто встанет в ту же очередь.
+    """
+    HEDGER.earn()
+    if hedge is None:
+        hedge = urlparse(url).netloc in HEDGE_HOSTS
+    threshold = HEDGER.threshold(url) if hedge else None
+    granted = asyncio.Event()
+    first = asyncio.ensure_future(_attempt(client, url, reader, params, granted))
+    pending = {first}
     try:
-        r = await client.get(url, headers=HEADERS, timeout=20)
-        if r.status_code == 200:
-            return r.text
-    except Exception:
-        pass
-    return None
+        if threshold is None:
+            return await first
+        slot_wait = asyncio.ensure_future(granted.wait())
+        try:
+            await asyncio.wait({first, slot_wait}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            slot_wait.cancel()
+        if not first.done():
+            await asyncio.wait({first}, timeout=threshold)
+        if first.done() or not HEDGER.try_spend():
+            return await first
+
+        pending.add(asyncio.ensure_future(_attempt(client, url, reader, params)))
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        return result
+            return None
+        finally:
+            HEDGER.release()
+    finally:
+        # в том числе когда отменили сам _get: попытки не должны висеть в очереди хоста
+        for task in pending:
+            task.cancel()
+
+async def _read_json(r: httpx.Response) -> Any:
+    await r.aread()
+    return r.json()
+
+async def _read_text(r: httpx.Response) -> str:
+    await r.aread()
+    return r.text
+
+async def fetch_json(
+    client: httpx.AsyncClient, url: str, hedge: bool | None = None, **params
+) -> Dict[str, Any] | None:
+    return await _get(client, url, _read_json, params=params, hedge=hedge)
+
+async def fetch_html(client: httpx.AsyncClient, url: str, hedge: bool | None = None) -> str | None:
+    return await _get(client, url, _read_text, hedge=hedge)
+
+def abs_url(base_url: str, href: str) -> str:
+    """Относительная ссылка -> абсолютная (от корня сайта base_url)."""
+    href = (href or "").strip()
+    if href.startswith("/"):
+        base = urlparse(base_url)
+        href = urljoin(f"{base.scheme}://{base.netloc}", href)
+    return href
+
+
+# Трекинговые параметры, которые не делают ссылку другой
+_URL_NOISE_PARAMS = {"fbclid", "gclid", "yclid", "ref", "from"}
+
+
+def normalize_url(url: str) -> str:
+    """Ключ ссылки для дедупликации: без схемы, www, якоря, utm-меток и хвостового '/'."""
+    u = urlparse((url or "").strip())
+    host = u.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = "&".join(sorted(
+        part for part in u.query.split("&")
+        if part and not part.lower().startswith("utm_")
+        and part.split("=", 1)[0].lower() not in _URL_NOISE_PARAMS
+    ))
+    key = host + u.path.rstrip("/")
+    return f"{key}?{query}" if query else key
+
+
+class AnchorCollector(HTMLParser):
+    """Инкрементальный сбор <a href>: (текст, ссылка) в порядке документа.
+
+    Кормим кусками по мере скачивания; как только набрали limit ссылок — done=True,
+    и дальше страницу можно не качать и не разбирать.
+    """
 
-def parse_tg_list(html_text: str, base_url: str) -> List[Dict[str, Any]]:
+    def __init__(self, limit: int = MAX_ANCHORS):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.links: List[Tuple[str, str]] = []
+        self._href: str | None = None
+        self._parts: List[str] = []
+        self._skip = 0  # внутри <script>/<style>
+
+    @property
+    def done(self) -> bool:
+        return len(self.links) >= self.limit
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            if self._href is not None:  # незакрытый <a> перед новым
+                self._close()
+            attrs_d = dict(attrs)
+            if "href" in attrs_d:
+                self._href = attrs_d["href"] or ""
+                self._parts = []
+        elif tag in ("script", "style"):
+            self._skip += 1
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            if self._href is not None:
+                self._close()
+        elif tag in ("script", "style") and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        # текст копим как есть: граница куска может прийтись на середину слова
+        if self._href is not None and not self._skip:
+            self._parts.append(data)
+
+    def _close(self):
+        if not self.done:
+            self.links.append((" ".join("".join(self._parts).split()), self._href.strip()))
+        self._href = None
+        self._parts = []
+
+
+async def fetch_links(
+    client: httpx.AsyncClient,
+    url: str,
+    limit: int = MAX_ANCHORS,
+    max_bytes: int | None = None,
+    hedge: bool | None = None,
+) -> List[Tuple[str, str]]:
+    """Потоково качаем страницу и собираем первые limit ссылок.
+
+    Останавливаемся, как только ссылок достаточно или скачано max_bytes
+    (по умолчанию — лимит из SOURCE_MAX_BYTES для хоста).
+    """
+    cap = max_bytes or SOURCE_MAX_BYTES.get(urlparse(url).netloc, DEFAULT_MAX_BYTES)
+
+    async def read(r: httpx.Response) -> List[Tuple[str, str]]:
+        parser = AnchorCollector(limit)
+        try:
+            try:
+                decoder = codecs.getincrementaldecoder(r.charset_encoding or "utf-8")(errors="replace")
+            except LookupError:
+                decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            got = 0
+            async for chunk in r.aiter_bytes():
+                got += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done or got >= cap:
+                    break
+        except Exception:
+            pass
+        return parser.links[:limit]
+
+    return await _get(client, url, read, hedge=hedge) or []
+
+def _tg_post_id(wrap) -> int:
+    """Номер поста из data-post="channel/123" (0 — если не нашли)."""
+    msg = wrap.select_one(".tgme_widget_message[data-post]")
+    if not msg:
+        return 0
+    tail = msg["data-post"].rsplit("/", 1)[-1]
+    return int(tail) if tail.isdigit() else 0
+
+def parse_tg_list(html_text: str, base_url: str, min_id: int = 0) -> List[Dict[str, Any]]:
+    """Посты со страницы t.me/s/<channel>; посты с id <= min_id пропускаем не разбирая."""
     out: List[Dict[str, Any]] = []
     if not html_text:
         return out
     soup = BeautifulSoup(html_text, "html.parser")
     wraps = soup.select(".tgme_widget_message_wrap")
     for w in wraps:
+        post_id = _tg_post_id(w)
+        if min_id and post_id <= min_id:
+            continue
         txt_tag = w.select_one(".tgme_widget_message_text")
         text = txt_tag.get_text(" ", strip=True) if txt_tag else ""
         if not text:
@@ -145,7 +749,7 @@ def parse_tg_list(html_text: str, base_url: str) -> List[Dict[str, Any]]:
                 ts = int(dt.timestamp())
             except Exception:
                 ts = 0
-        link = base_url
+        link = f"{base_url}/{post_id}" if post_id else base_url
         a_tag = txt_tag.select_one("a[href]") if txt_tag else None
         if a_tag and a_tag["href"].startswith(("http://", "https://")):
             link = a_tag["href"]
@@ -164,23 +768,64 @@ def parse_tg_list(html_text: str, base_url: str) -> List[Dict[str, Any]]:
             "summary": short(text, 320),
             "url": link,
             "image": img,
-            "ts": ts
+            "ts": ts,
+            "id": post_id,
         })
     return out
 
-async def get_telegram_news(channels: List[str], limit_per_channel: int = 4, total_limit: int = 10) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        for ch in channels:
-            page = await fetch_html(client, f"https://t.me/s/{ch}")
-            parsed = parse_tg_list(page or "", f"https://t.me/{ch}")
-            if parsed:
-                items.extend(parsed[:limit_per_channel])
-    items.sort(key=lambda x: x.get("ts", 0), reverse=True)
-    for it in items:
-        it.pop("ts", None)
-    return items[:total_limit]
+# Состояние по каналам: курсор (последний виденный id) + кольцевой буфер постов (старые -> новые)
+TG_STATE: Dict[str, Dict[str, Any]] = {}
+
+def tg_state(channel: str) -> Dict[str, Any]:
+    st = TG_STATE.get(channel)
+    if st is None:
+        st = TG_STATE[channel] = {"last_id": 0, "items": deque(maxlen=TG_RING_SIZE)}
+    return st
+
+def _tg_behind(fresh: List[Dict[str, Any]], max_age: float) -> bool:
+    """Страница ?after= не дотянула до головы канала: она полная или самый новый пост на ней уже старый."""
+    if len(fresh) >= TG_PAGE_FULL:
+        return True
+    newest = max((it["ts"] for it in fresh), default=0)
+    return bool(newest) and newest < now_ts() - max_age
+
+async def refresh_tg_channel(client: httpx.AsyncClient, channel: str,
+                             max_age: float = DEFAULT_TTL) -> List[Dict[str, Any]] | None:
+    """Докачиваем только посты новее курсора и вливаем их в буфер канала.
 
+    ?after=<id> — это ~20 постов сразу за курсором, а не самые свежие: после затишья (ночь)
+    одна страница двигает курсор лишь на шаг. Если отстали (см. _tg_behind) — добираем
+    голову t.me/s/<channel>; середину между ними не качаем.
+    Возвращает новые посты (старые -> новые); при ошибке — None, буфер не трогаем.
+    """
+    st = tg_state(channel)
+    last_id = st["last_id"]
+    head_url = f"https://t.me/s/{channel}"
+    base_url = f"https://t.me/{channel}"
+    page = await fetch_html(client, f"{head_url}?after={last_id}" if last_id else head_url)
+    if page is None:
+        return None
+    with span("parse", src=f"tg:{channel}"):
+        fresh = [it for it in parse_tg_list(page, base_url, min_id=last_id) if it["id"]]
+    if last_id and _tg_behind(fresh, max_age):
+        head = await fetch_html(client, head_url)
+        if head is not None:
+            with span("parse", src=f"tg:{channel}"):
+                fresh += [it for it in parse_tg_list(head, base_url, min_id=last_id) if it["id"]]
+    # дедуп по id: страницы пересекаются между собой и с тем, что уже в буфере
+    known = {it["id"] for it in st["items"]}
+    fresh = sorted({it["id"]: it for it in fresh if it["id"] not in known}.values(), key=lambda x: x["id"])
+    for it in fresh:
+        st["items"].append(it)
+    if fresh:
+        st["last_id"] = max(last_id, fresh[-1]["id"])
+    return fresh
+
+def tg_recent(channel: str, limit: int | None = None) -> List[Dict[str, Any]]:
+    """Последние посты канала из буфера (новые первыми), без сети."""
+    ring = TG_STATE.get(channel, {}).get("items") or ()
+    out = [dict(it) for it in reversed(ring)]
+    return out[:limit]
 
 def _daily_seed(salt: str = "") -> str:
     # детерминированная соль на текущий день (MSK)
@@ -211,21 +856,7 @@ def _is_allowed_event(title: str) -> bool:
 
     return False
 
-# ====== AGRO helpers + сборщик ======
-
-def _dedupe_by_url_title(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    seen: set[tuple[str, str]] = set()
-    out: List[Dict[str, Any]] = []
-    for it in items:
-        u = (it.get("url") or "").strip().lower()
-        t = (it.get("title") or "").strip().lower()
-        key = (u, t)
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(it)
-    return out
-
+# ================== AGRO (фильтр бизнес-повестки) ===================
 def _agro_keep(title: str) -> bool:
     """Фильтр 'бизнес‑повестки' для агро."""
     t = (title or "").lower()
@@ -249,68 +880,6 @@ def _agro_keep(title: str) -> bool:
         return False
     return any(x in t for x in allow)
 
-async def get_agro(limit: int = 10) -> List[Dict[str, Any]]:
-    """Новости агро: сайты + Telegram, фильтр бизнес-повестки, дедуп, дневная рандомизация."""
-    items: List[Dict[str, Any]] = []
-
-    # --- 1) Профильные сайты ---
-    sources = [
-        "https://www.agroinvestor.ru/news/",
-        "https://www.agroxxi.ru/novosti.html",
-        "https://mcx.gov.ru/press-service/news/",
-    ]
-    try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15) as client:
-            for url in sources:
-                html_text = await fetch_html(client, url)
-                if not html_text:
-                    continue
-                soup = BeautifulSoup(html_text, "html.parser")
-                for a in soup.select("a[href]")[:120]:
-                    title = a.get_text(" ", strip=True)
-                    href = (a.get("href") or "").strip()
-                    if not title or len(title) < 12:
-                        continue
-                    if not _agro_keep(title):
-                        continue
-                    # абсолютная ссылка
-                    if href.startswith("/"):
-                        from urllib.parse import urlparse, urljoin
-                        base = urlparse(url)
-                        href = urljoin(f"{base.scheme}://{base.netloc}", href)
-                    if not href.startswith("http"):
-                        continue
-                    items.append({
-                        "title": short(title, 120),
-                        "summary": "",
-                        "url": href,
-                        "image": "",
-                        "_src": "site",
-                    })
-    except Exception:
-        pass
-
-    # --- 2) Telegram-каналы (существующий список AGRO_TELEGRAM) ---
-    try:
-        tg = await get_telegram_news(AGRO_TELEGRAM, limit_per_channel=3, total_limit=15)
-        for it in tg:
-            title = (it.get("title") or "").strip()
-            if title and _agro_keep(title):
-                items.append({
-                    "title": short(title, 120),
-                    "summary": short(it.get("summary") or "", 220),
-                    "url": it.get("url") or "",
-                    "image": it.get("image") or "",
-                    "_src": "tg",
-                })
-    except Exception:
-        pass
-
-    # Дедуп + дневная рандомизация + лимит
-    items = _dedupe_by_url_title(items)
-    random.Random(_daily_seed("agro")).shuffle(items)
-    return items[:limit]
-
 # ================== SVO (телеграм + фильтр + дедуп) ===================
 def _svo_keep(text: str) -> bool:
     """Фильтр СВО: мягче. Пускаем Путин/переговоры, иначе нужна связка из 2 групп."""
@@ -358,217 +927,30 @@ def _svo_keep(text: str) -> bool:
     return score >= 1 and (has_core or has_actions)
 
 
-async def get_svo(limit: int = 10) -> List[Dict[str, Any]]:
-    """Новости СВО из телеграм-каналов + жёсткий фильтр и дедупликация."""
-    raw = await get_telegram_news(
-        SVO_TELEGRAM,
-        limit_per_channel=6,   # берём побольше сырья
-        total_limit=40
-    )
-
-    out: List[Dict[str, Any]] = []
-    seen: set[str] = set()
-
-    for it in raw:  # уже отсортировано по времени внутри get_telegram_news
-        title = (it.get("title") or "").strip()
-        if not title or not _svo_keep(title):
-            continue
-
-        key = title.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-
-        out.append({
-            "title": short(title, 160),
-            "summary": short(it.get("summary") or "", 240),
-            "url": it.get("url") or "",
-            "image": it.get("image") or "",
-        })
-
-        if len(out) >= limit:
-            break
-
-    return out
-
-# ================== AI (новости, строгий фильтр + дедуп) ===================
-async def get_ai_news(limit: int = 10) -> List[Dict[str, Any]]:
-    """AI-лента: берём заголовки, фильтруем по ключевым словам, дедупим и нормализуем ссылки."""
-    sites = [
-        "https://techcrunch.com/tag/artificial-intelligence/",
-        "https://venturebeat.com/category/ai/",
-        "https://www.technologyreview.com/topic/artificial-intelligence/",
-        "https://www.theverge.com/artificial-intelligence",
-        "https://openai.com/blog/",
-        "https://vc.ru/ai",
-        "https://rb.ru/tag/iskusstvennyy-intellekt/",
-        "https://www.computerra.ru/tag/iskusstvennyj-intellekt/",
-    ]
-
-    # ужесточённые ключевые слова (ядро)
-    kw_core = [
-        "ai", "искусственный интеллект", "нейросет", "llm", "gpt", "genai",
-        "модель", "foundation model", "трансформер", "r1", "mistral", "llama",
-        "distillation", "fine-tuning", "inference", "rag", "agent"
-    ]
-    # «сигнальные» маркеры (релизы/исследования/веса/opensource и т.п.)
-    kw_signal = [
-        "релиз", "запуск", "announc", "update", "обновлен", "weights",
-        "research", "study", "paper", "benchmark", "sota",
-        "open source", "opensource", "github", "репозитор", "датасет"
-    ]
-
-    out: List[Dict[str, Any]] = []
-    seen_titles: set[str] = set()
-    seen_urls: set[str] = set()
-
-    def good(title: str) -> bool:
-        t = (title or "").lower()
-        if not any(k in t for k in kw_core):
-            return False
-        # усиливаем материалы с сигналами
-        if any(k in t for k in kw_signal):
-            return True
-        # и пропускаем явно «про модели»
-        return any(k in t for k in ["model", "модель", "llm", "gpt", "mistral", "llama", "r1"])
-
-    async with httpx.AsyncClient(follow_redirects=True, timeout=15) as client:
-        for url in sites:
-            page = await fetch_html(client, url)
-            if not page:
-                continue
-            soup = BeautifulSoup(page, "html.parser")
-            for a in soup.select("a[href]")[:120]:
-                title = a.get_text(" ", strip=True)
-                href = (a.get("href") or "").strip()
-                if not title or len(title) < 20:
-                    continue
-                if not good(title):
-                    continue
-
-                # нормализация относительных ссылок
-                if href.startswith("/"):
-                    from urllib.parse import urlparse, urljoin
-                    base = urlparse(url)
-                    href = urljoin(f"{base.scheme}://{base.netloc}", href)
-                if not href.startswith("http"):
-                    continue
-
-                # дедуп по заголовку/ссылке
-                key_t = title.lower()
-                key_u = href.split("?")[0].rstrip("/")
-                if key_t in seen_titles or key_u in seen_urls:
-                    continue
-                seen_titles.add(key_t)
-                seen_urls.add(key_u)
-
-                out.append({
-                    "title": short(title, 120),
-                    "summary": "",
-                    "url": href,
-                    "image": "",
-                })
-
-    random.Random(_daily_seed("ai")).shuffle(out)
-    return out[:limit]
-
-# ================== АФИША (KudaGo + Афиша.ру + Telegram, фильтры) ===================
-async def get_afisha(limit: int = 10) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-
-    # --- 1) KudaGo ---
-    try:
-        today = now_ts()
-        month = int((datetime.now(MSK_TZ) + timedelta(days=30)).timestamp())
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15) as client:
-            data = await fetch_json(
-                client,
-                "https://kudago.com/public-api/v1.4/events/",
-                fields="title,dates,place,site_url,images,description",
-                location="msk",
-                actual_since=today,
-                actual_until=month,
-                page_size=40,
-                order_by="-publication_date",
-                expand="place",
-                text_format="plain",
-            )
-            for e in (data or {}).get("results", []):
-                title = (e.get("title") or "").strip()
-                if not _is_allowed_event(title):
-                    continue
-
-                date_str = ""
-                dates = e.get("dates") or []
-                if dates and dates[0].get("start"):
-                    try:
-                        start = datetime.fromtimestamp(dates[0]["start"], MSK_TZ)
-                        date_str = start.strftime("%d.%m %H:%M")
-                    except Exception:
-                        pass
-
-                place = (e.get("place") or {}).get("title") or ""
-                summary_parts = [date_str, place]
-                summary = " · ".join(x for x in summary_parts if x) or (e.get("description") or "Событие")
-
-                img = e["images"][0].get("image") if e.get("images") else ""
-                items.append({
-                    "title": short(title, 120),
-                    "summary": short(summary, 240),
-                    "url": e.get("site_url") or "",
-                    "image": img,
-                    "_src": "kudago",
-                })
-    except Exception:
-        pass
-
-    # --- 2) Afisha.ru ---
-    try:
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15) as client:
-            html_text = await fetch_html(client, "https://www.afisha.ru/msk/")
-            if html_text:
-                soup = BeautifulSoup(html_text, "html.parser")
-                for a in soup.select("a[href]")[:120]:
-                    text = a.get_text(" ", strip=True)
-                    href = a.get("href") or ""
-                    if not text or len(text) < 8:
-                        continue
-                    if href.startswith("/"):
-                        href = "https://www.afisha.ru" + href
-                    if not _is_allowed_event(text):
-                        continue
-                    items.append({
-                        "title": short(text, 120),
-                        "summary": "",
-                        "url": href,
-                        "image": "",
-                        "_src": "afisha",
-                    })
-    except Exception:
-        pass
-
-    # --- 3) Telegram ---
-    try:
-        tg = await get_telegram_news(AFISHA_TELEGRAM, limit_per_channel=3, total_limit=12)
-        for it in tg:
-            title = (it.get("title") or "").strip()
-            if not title:
-                continue
-            if not _is_allowed_event(title):
-                continue
-            items.append({
-                "title": short(title, 120),
-                "summary": short(it.get("summary") or "", 240),
-                "url": it.get("url") or "",
-                "image": it.get("image") or "",
-                "_src": "tg",
-            })
-    except Exception:
-        pass
+# ================== AI (строгий фильтр) ===================
+# ужесточённые ключевые слова (ядро)
+AI_KW_CORE = [
+    "ai", "искусственный интеллект", "нейросет", "llm", "gpt", "genai",
+    "модель", "foundation model", "трансформер", "r1", "mistral", "llama",
+    "distillation", "fine-tuning", "inference", "rag", "agent"
+]
+# «сигнальные» маркеры (релизы/исследования/веса/opensource и т.п.)
+AI_KW_SIGNAL = [
+    "релиз", "запуск", "announc", "update", "обновлен", "weights",
+    "research", "study", "paper", "benchmark", "sota",
+    "open source", "opensource", "github", "репозитор", "датасет"
+]
+
+def _ai_keep(title: str) -> bool:
+    t = (title or "").lower()
+    if not any(k in t for k in AI_KW_CORE):
+        return False
+    # усиливаем материалы с сигналами
+    if any(k in t for k in AI_KW_SIGNAL):
+        return True
+    # и пропускаем явно «про модели»
+    return any(k in t for k in ["model", "модель", "llm", "gpt", "mistral", "llama", "r1"])
 
-    # --- рандомизация на день и лимит ---
-    random.Random(_daily_seed("afisha")).shuffle(items)
-    return items[:limit]
 
 def six_months_ago_str() -> str:
     return (datetime.now(MSK_TZ) - timedelta(days=182)).strftime("%Y-%m-%d")
@@ -597,59 +979,170 @@ async def tmdb_collect(client: httpx.AsyncClient, url: str, base_params: dict, p
         out.extend(results)
     return out
 
-# ================== ОБНОВЛЕНО: СЕРИАЛЫ (рандомизация с дневной солью) ==================
-async def get_series(limit: int = 5) -> List[Dict[str, Any]]:
-    if not TMDB_API_KEY:
-        return [{
-            "title": "Нет TMDB ключа",
-            "summary": "Добавьте TMDB_API_KEY в .env и перезапустите.",
-            "url": "",
-            "image": ""
-        }]
+# ================== РЕЕСТР ИСТОЧНИКОВ + ПАЙПЛАЙН ===================
+@dataclass(frozen=True)
+class Source:
+    """Один источник темы. kind: site | tg | kudago | tmdb (см. SOURCE_FETCHERS)."""
 
-    url = "https://api.themoviedb.org/3/discover/tv"
-    params = {
-        "api_key": TMDB_API_KEY,
-        "language": "ru-RU",
-        "sort_by": "vote_average.desc",
-        "vote_average.gte": 7.0,
-        "first_air_date.gte": six_months_ago_str(),
-        "vote_count.gte": 100,
-        "include_adult": "false",
-        "page": 1,
+    kind: str
+    target: str               # URL страницы, имя канала, "tv"/"movie" для TMDB
+    min_title: int = 0        # ссылки с более коротким текстом — не заголовки
+    title_len: int = 120
+    summary_len: int = 240
+    per_channel: int = 10     # tg: сколько последних постов канала брать из буфера
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.target}"
+
+
+@dataclass(frozen=True)
+class TopicSpec:
+    """Тема = источники + общий фильтр заголовков + правила дедупа и порядка."""
+
+    sources: Tuple[Source, ...]
+    keep: Callable[[str], bool] | None = None
+    dedupe: Tuple[str, ...] = ("url+title",)  # дубль хотя бы по одному ключу — выкидываем
+    order: str = "shuffle"                    # shuffle — дневная перестановка, time — свежие первыми
+
+
+def sites(*urls: str, min_title: int = 0) -> Tuple[Source, ...]:
+    return tuple(Source("site", u, min_title=min_title) for u in urls)
+
+def channels(names: List[str], **kw) -> Tuple[Source, ...]:
+    return tuple(Source("tg", ch, **kw) for ch in names)
+
+
+# Добавить сайт или канал в тему — строчка здесь, а не ещё один цикл
+TOPICS: Dict[str, TopicSpec] = {
+    "afisha": TopicSpec(
+        sources=(
+            Source("kudago", "https://kudago.com/public-api/v1.4/events/"),
+            *sites("https://www.afisha.ru/msk/", min_title=8),
+            *channels(AFISHA_TELEGRAM, summary_len=240),
+        ),
+        keep=_is_allowed_event,
+    ),
+    "series": TopicSpec(sources=(Source("tmdb", "tv"),), dedupe=("url",)),
+    "movies": TopicSpec(sources=(Source("tmdb", "movie"),), dedupe=("url",)),
+    "agro": TopicSpec(
+        sources=(
+            *sites(
+                "https://www.agroinvestor.ru/news/",
+                "https://www.agroxxi.ru/novosti.html",
+                "https://mcx.gov.ru/press-service/news/",
+                min_title=12,
+            ),
+            *channels(AGRO_TELEGRAM, summary_len=220),
+        ),
+        keep=_agro_keep,
+    ),
+    "svo": TopicSpec(
+        sources=channels(SVO_TELEGRAM, per_channel=20),
+        keep=_svo_keep,
+        dedupe=("title",),
+        order="time",
+    ),
+    "ai": TopicSpec(
+        sources=sites(
+            "https://techcrunch.com/tag/artificial-intelligence/",
+            "https://venturebeat.com/category/ai/",
+            "https://www.technologyreview.com/topic/artificial-intelligence/",
+            "https://www.theverge.com/artificial-intelligence",
+            "https://openai.com/blog/",
+            "https://vc.ru/ai",
+            "https://rb.ru/tag/iskusstvennyy-intellekt/",
+            "https://www.computerra.ru/tag/iskusstvennyj-intellekt/",
+            min_title=20,
+        ),
+        keep=_ai_keep,
+        dedupe=("title", "url"),
+    ),
+}
+
+TMDB_LANGUAGES = ("en", "ru", "ko", "ja", "es", "fr", "de", "it")
+TMDB_DISCOVER = {
+    # kind: (поле даты выхода, минимум оценок, путь карточки на сайте, запасное название)
+    "tv": ("first_air_date.gte", 100, "tv", "Сериал"),
+    "movie": ("primary_release_date.gte", 200, "movie", "Фильм"),
+}
+
+# Последний прогон пайплайна по теме: длительность стадий и источников, мс
+PIPELINE_STATS: Dict[str, Dict[str, Any]] = {}
+
+_HTTP: httpx.AsyncClient | None = None
+
+def http_client() -> httpx.AsyncClient:
+    """Общий клиент для всех источников (пул соединений живёт между обновлениями)."""
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(follow_redirects=True, timeout=15)
+    return _HTTP
+
+
+def _card(title: str, summary: str, url: str, image: str, src: Source, ts: int = 0) -> Dict[str, Any]:
+    return {
+        "title": short(title, src.title_len),
+        "summary": short(summary, src.summary_len) if summary else "",
+        "url": url,
+        "image": image,
+        "ts": ts,
+        "_src": src.kind,
     }
 
-    out: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        data = await fetch_json(client, url, **params)
-        for tv in (data or {}).get("results", []):
-            if tv.get("original_language") not in ("en", "ru", "ko", "ja", "es", "fr", "de", "it"):
-                continue
-            title = tv.get("name") or tv.get("original_name") or "Сериал"
-            vote = tv.get("vote_average") or 0.0
-            cnt = tv.get("vote_count") or 0
-            overview = tv.get("overview") or "Описание отсутствует."
-            poster = tv.get("poster_path") or ""
-            img = f"https://image.tmdb.org/t/p/w780{poster}" if poster else ""
-            tmdb_id = tv.get("id")
-            more = f"https://www.themoviedb.org/tv/{tmdb_id}" if tmdb_id else ""
-            rating_str = f"Рейтинг TMDB: {vote:.1f} ({cnt} оценок)" if vote > 0 else "Рейтинг TMDB: н/д"
-            out.append({
-                "title": title,
-                "summary": f"{rating_str}. {short(overview, 220)}",
-                "url": more,
-                "image": img,
-            })
-
-    # === рандомизация на день ===
-    today_salt = datetime.now(MSK_TZ).strftime("%Y-%m-%d") + "series"
-    random.Random(today_salt).shuffle(out)
+async def _fetch_site(client: httpx.AsyncClient, topic: str, src: Source) -> List[Dict[str, Any]]:
+    links = await fetch_links(client, src.target)
+    if links:
+        SCHEDULER.observe_content(topic, src.name, links)
+    out = []
+    for title, href in links:
+        if not href or not title or len(title) < src.min_title:
+            continue
+        out.append(_card(title, "", abs_url(src.target, href), "", src))
+    return out
 
-    return out[:limit]
+async def _fetch_tg(client: httpx.AsyncClient, topic: str, src: Source) -> List[Dict[str, Any]]:
+    fresh = await refresh_tg_channel(client, src.target, SCHEDULER.source_interval(topic, src.name))
+    if fresh is not None:
+        SCHEDULER.observe_posts(topic, src.name, [it["ts"] for it in fresh])
+    return [
+        _card(it["title"], it["summary"], it["url"], it["image"], src, it["ts"])
+        for it in tg_recent(src.target, src.per_channel)
+    ]
 
+async def _fetch_kudago(client: httpx.AsyncClient, topic: str, src: Source) -> List[Dict[str, Any]]:
+    month = int((datetime.now(MSK_TZ) + timedelta(days=30)).timestamp())
+    data = await fetch_json(
+        client,
+        src.target,
+        fields="title,dates,place,site_url,images,description",
+        location="msk",
+        actual_since=now_ts(),
+        actual_until=month,
+        page_size=40,
+        order_by="-publication_date",
+        expand="place",
+        text_format="plain",
+    )
+    results = (data or {}).get("results", [])
+    if data:
+        SCHEDULER.observe_content(topic, src.name, [e.get("site_url") for e in results])
+    out = []
+    for e in results:
+        date_str = ""
+        dates = e.get("dates") or []
+        if dates and dates[0].get("start"):
+            try:
+                date_str = datetime.fromtimestamp(dates[0]["start"], MSK_TZ).strftime("%d.%m %H:%M")
+            except Exception:
+                pass
+        place = (e.get("place") or {}).get("title") or ""
+        summary = " · ".join(x for x in (date_str, place) if x) or (e.get("description") or "Событие")
+        img = e["images"][0].get("image") if e.get("images") else ""
+        out.append(_card((e.get("title") or "").strip(), summary, e.get("site_url") or "", img, src))
+    return out
 
-# ================== ОБНОВЛЕНО: ФИЛЬМЫ (рандомизация с дневной солью) ===================
-async def get_movies(limit: int = 5) -> List[Dict[str, Any]]:
+async def _fetch_tmdb(client: httpx.AsyncClient, topic: str, src: Source) -> List[Dict[str, Any]]:
     if not TMDB_API_KEY:
         return [{
             "title": "Нет TMDB ключа",
@@ -657,50 +1150,504 @@ async def get_movies(limit: int = 5) -> List[Dict[str, Any]]:
             "url": "",
             "image": ""
         }]
-
-    url = "https://api.themoviedb.org/3/discover/movie"
+    date_field, min_votes, path, fallback = TMDB_DISCOVER[src.target]
+    url = f"https://api.themoviedb.org/3/discover/{src.target}"
     params = {
         "api_key": TMDB_API_KEY,
         "language": "ru-RU",
         "sort_by": "vote_average.desc",
         "vote_average.gte": 7.0,
-        "primary_release_date.gte": six_months_ago_str(),
-        "vote_count.gte": 200,
+        date_field: six_months_ago_str(),
+        "vote_count.gte": min_votes,
         "include_adult": "false",
-        "page": 1,
     }
+    results = await tmdb_collect(client, url, params, pages=TMDB_POOL_PAGES)
+    if results:
+        SCHEDULER.observe_content(topic, src.name, [x.get("id") for x in results])
+    out = []
+    for x in results:
+        if x.get("original_language") not in TMDB_LANGUAGES:
+            continue
+        title = x.get("name") or x.get("title") or x.get("original_name") or x.get("original_title") or fallback
+        vote = x.get("vote_average") or 0.0
+        cnt = x.get("vote_count") or 0
+        overview = x.get("overview") or "Описание отсутствует."
+        poster = x.get("poster_path") or ""
+        img = f"https://image.tmdb.org/t/p/w780{poster}" if poster else ""
+        more = f"https://www.themoviedb.org/{path}/{x['id']}" if x.get("id") else ""
+        rating_str = f"Рейтинг TMDB: {vote:.1f} ({cnt} оценок)" if vote > 0 else "Рейтинг TMDB: н/д"
+        out.append({
+            "title": title,
+            "summary": f"{rating_str}. {short(overview, 220)}",
+            "url": more,
+            "image": img,
+        })
+    return out
+
+SOURCE_FETCHERS = {
+    "site": _fetch_site,
+    "tg": _fetch_tg,
+    "kudago": _fetch_kudago,
+    "tmdb": _fetch_tmdb,
+}
+
+
+def _dedupe_key(it: Dict[str, Any], kind: str) -> str:
+    title = (it.get("title") or "").strip().lower()
+    url = normalize_url(it.get("url") or "")
+    if kind == "title":
+        return title
+    if kind == "url":
+        return url
+    return f"{url} {title}"
 
+def _dedupe(items: List[Dict[str, Any]], kinds: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    seen: Dict[str, set] = {k: set() for k in kinds}
     out: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(follow_redirects=True) as client:
-        data = await fetch_json(client, url, **params)
-        for mv in (data or {}).get("results", []):
-            if mv.get("original_language") not in ("en", "ru", "ko", "ja", "es", "fr", "de", "it"):
+    for it in items:
+        keys = [(k, _dedupe_key(it, k)) for k in kinds]
+        # пустой ключ (нет ссылки) дублем не считаем
+        if any(key and key in seen[k] for k, key in keys):
+            continue
+        for k, key in keys:
+            seen[k].add(key)
+        out.append(it)
+    return out
+
+
+# Последний непустой результат источника: (тема, src.name) -> {"ts", "items"}
+SOURCE_RESULTS: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+async def _run_source(client: httpx.AsyncClient, topic: str, src: Source, timings: Dict[str, int],
+                      force: bool = False):
+    key = (topic, src.name)
+    last = SOURCE_RESULTS.get(key)
+    if not force and last and now_ts() - last["ts"] < SCHEDULER.source_interval(topic, src.name):
+        # тему обновляет более частый сосед, а этому источнику ещё рано — отдаём прошлый результат
+        timings[src.name] = 0
+        return [dict(it) for it in last["items"]]
+    started = time.perf_counter()
+    try:
+        items = await SOURCE_FETCHERS[src.kind](client, topic, src)
+    except Exception:
+        log.exception("%s: источник %s упал", topic, src.name)
+        return None
+    finally:
+        ended = time.perf_counter()
+        timings[src.name] = int((ended - started) * 1000)
+        trace_event("source", started, ended, src=src.name)
+    if items:
+        # копии: дальше по пайплайну карточки правятся на месте
+        SOURCE_RESULTS[key] = {"ts": now_ts(), "items": [dict(it) for it in items]}
+    return items
+
+async def run_pipeline(topic: str, spec: TopicSpec, force: bool = False) -> List[Dict[str, Any]]:
+    """fetch+parse (все источники темы параллельно) -> filter -> normalize -> dedupe -> order.
+
+    force — перекачать все источники, не глядя на их интервалы.
+    """
+    stages: Dict[str, int] = {}
+    per_source: Dict[str, int] = {}
+    mark = time.perf_counter()
+
+    def lap(stage: str):
+        nonlocal mark
+        now = time.perf_counter()
+        stages[stage] = int((now - mark) * 1000)
+        if stage != "fetch":  # fetch уже расписан по источникам
+            trace_event(stage, mark, now, topic=topic)
+        mark = now
+
+    client = http_client()
+    batches = await asyncio.gather(*(_run_source(client, topic, src, per_source, force) for src in spec.sources))
+    items = [it for batch in batches for it in batch or ()]
+    # упал или ничего не принёс — для /ready это не «тема пуста», а «источник не ответил»
+    failed = [src.name for src, batch in zip(spec.sources, batches) if not batch]
+    lap("fetch")
+
+    if spec.keep:
+        items = [it for it in items if (it.get("title") or "").strip() and spec.keep(it["title"])]
+    lap("filter")
+
+    for it in items:
+        it["url"] = (it.get("url") or "").strip()
+    items = [it for it in items if not it["url"] or it["url"].startswith(("http://", "https://"))]
+    lap("normalize")
+
+    if spec.order == "time":
+        items.sort(key=lambda x: x.get("ts", 0), reverse=True)  # дедуп оставит самый свежий
+    items = _dedupe(items, spec.dedupe)
+    lap("dedupe")
+
+    if spec.order == "shuffle":
+        random.Random(_daily_seed(topic)).shuffle(items)
+    for it in items:
+        it.pop("ts", None)
+        it.pop("_src", None)
+    lap("order")
+
+    PIPELINE_STATS[topic] = {
+        "ts": now_ts(), "items": len(items), "stages": stages, "sources": per_source, "failed": failed,
+    }
+    return items
+
+
+# ================== АРХИВ + ПОЛНОТЕКСТОВЫЙ ПОИСК (SQLite FTS5) ===================
+ARCHIVE_DB = os.getenv("ARCHIVE_DB", "archive.sqlite3")
+ARCHIVE_BATCH = 500          # столько накопилось — пишем сразу, не дожидаясь таймера
+ARCHIVE_FLUSH_SEC = 5        # иначе пишем пачкой раз в N секунд
+ARCHIVE_KNOWN_MAX = 50_000   # ключи, которые уже точно в базе (чтобы не гонять их в SQLite)
+SEARCH_MAX_LIMIT = 50
+
+# --- стемминг для русского (Snowball, Russian) ---
+_RU_VOWELS = "аеиоуыэюя"
+
+def _ru_endings(*words: str) -> Tuple[str, ...]:
+    return tuple(sorted(words, key=len, reverse=True))
+
+_RU_GERUND_1 = _ru_endings("в", "вши", "вшись")
+_RU_GERUND_2 = _ru_endings("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+_RU_ADJECTIVE = _ru_endings(
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+_RU_PARTICIPLE_1 = _ru_endings("ем", "нн", "вш", "ющ", "щ")
+_RU_PARTICIPLE_2 = _ru_endings("ивш", "ывш", "ующ")
+_RU_REFLEXIVE = _ru_endings("ся", "сь")
+_RU_VERB_1 = _ru_endings(
+    "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно",
+)
+_RU_VERB_2 = _ru_endings(
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+    "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю",
+)
+_RU_NOUN = _ru_endings(
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий", "й",
+    "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)
+
+
+def _ru_cut(rv: str, group1: Tuple[str, ...], group2: Tuple[str, ...] = ()) -> str | None:
+    """Срезаем самое длинное окончание; окончания group1 — только после 'а'/'я'. None — не нашли."""
+    best = ""
+    for suf in group1 + group2:
+        if len(suf) > len(best) and rv.endswith(suf):
+            best = suf
+    if not best:
+        return None
+    stem = rv[: -len(best)]
+    if best in group1 and best not in group2 and not stem.endswith(("а", "я")):
+        return None
+    return stem
+
+
+def _ru_region(word: str, start: int) -> int:
+    """Начало R1/R2: после первой согласной, идущей за гласной."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _RU_VOWELS and word[i - 1] in _RU_VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem_ru(word: str) -> str:
+    word = word.replace("ё", "е")
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _RU_VOWELS), len(word))
+    head, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе (возвратность) + прилагательное/глагол/существительное
+    cut = _ru_cut(rv, _RU_GERUND_1, _RU_GERUND_2)
+    if cut is not None:
+        rv = cut
+    else:
+        cut = _ru_cut(rv, (), _RU_REFLEXIVE)
+        if cut is not None:
+            rv = cut
+        cut = _ru_cut(rv, (), _RU_ADJECTIVE)
+        if cut is not None:
+            participle = _ru_cut(cut, _RU_PARTICIPLE_1, _RU_PARTICIPLE_2)
+            rv = participle if participle is not None else cut
+        else:
+            cut = _ru_cut(rv, _RU_VERB_1, _RU_VERB_2)
+            if cut is None:
+                cut = _ru_cut(rv, (), _RU_NOUN)
+            if cut is not None:
+                rv = cut
+
+    # Шаг 2: 'и'
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные 'ост'/'ость' в R2
+    word = head + rv
+    r2 = _ru_region(word, _ru_region(word, 0))
+    for suf in ("ость", "ост"):
+        if word.endswith(suf) and len(word) - len(suf) >= r2:
+            rv = rv[: -len(suf)]
+            break
+
+    # Шаг 4: 'нн' -> 'н', превосходная степень, мягкий знак
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        cut = _ru_cut(rv, (), ("ейше", "ейш"))
+        if cut is not None:
+            rv = cut[:-1] if cut.endswith("нн") else cut
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+    return head + rv
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-яё]")
+
+
+def stem_text(text: str) -> List[str]:
+    """Слова текста в индексной форме: русские — по Snowball, остальные отдаём FTS5 (porter)."""
+    out: List[str] = []
+    for tok in _WORD_RE.findall((text or "").lower()):
+        if len(tok) > 2 and _CYRILLIC_RE.search(tok):
+            # Snowball оставляет гласную у части форм ("урожай" -> "урожа", "урожая" -> "урож") — добиваем
+            stem = stem_ru(tok)
+            tok = stem.rstrip(_RU_VOWELS) if len(stem.rstrip(_RU_VOWELS)) >= 3 else stem
+        out.append(tok)
+    return out
+
+
+class Archive:
+    """Архив всех собранных карточек: SQLite + FTS5, дедуп по нормализованной ссылке.
+
+    add() только складывает в очередь; на диск пишем пачками в одной транзакции
+    из фонового цикла (run), в отдельном потоке.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pending: List[Tuple[str, str, Dict[str, Any]]] = []
+        self.known: "OrderedDict[str, None]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id      INTEGER PRIMARY KEY,
+                    url_key TEXT NOT NULL UNIQUE,
+                    topic   TEXT NOT NULL,
+                    title   TEXT NOT NULL,
+                    summary TEXT NOT NULL DEFAULT '',
+                    url     TEXT NOT NULL DEFAULT '',
+                    image   TEXT NOT NULL DEFAULT '',
+                    added   INTEGER NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+                    title, summary, topic,
+                    content='',
+                    tokenize='porter unicode61 remove_diacritics 2'
+                );
+            """)
+            # заголовок весит втрое больше описания, тема в ранжировании не участвует
+            db.execute("INSERT INTO items_fts(items_fts, rank) VALUES('rank', 'bm25(3.0, 1.0, 0.0)')")
+            db.commit()
+            self._db = db
+        return self._db
+
+    def add(self, topic: str, items: List[Dict[str, Any]]):
+        for it in items:
+            title = (it.get("title") or "").strip()
+            if not title:
                 continue
-            title = mv.get("title") or mv.get("original_title") or "Фильм"
-            vote = mv.get("vote_average") or 0.0
-            cnt = mv.get("vote_count") or 0
-            overview = mv.get("overview") or "Описание отсутствует."
-            poster = mv.get("poster_path") or ""
-            img = f"https://image.tmdb.org/t/p/w780{poster}" if poster else ""
-            tmdb_id = mv.get("id")
-            more = f"https://www.themoviedb.org/movie/{tmdb_id}" if tmdb_id else ""
-            rating_str = f"Рейтинг TMDB: {vote:.1f} ({cnt} оценок)" if vote > 0 else "Рейтинг TMDB: н/д"
-            out.append({
-                "title": title,
-                "summary": f"{rating_str}. {short(overview, 220)}",
-                "url": more,
-                "image": img,
-            })
-
-    # === рандомизация на день ===
-    today_salt = datetime.now(MSK_TZ).strftime("%Y-%m-%d") + "movies"
-    random.Random(today_salt).shuffle(out)
+            key = normalize_url(it.get("url") or "") or f"title:{title.lower()}"
+            if key in self.known:
+                continue
+            self._remember(key)
+            self.pending.append((key, topic, it))
+        if len(self.pending) >= ARCHIVE_BATCH:
+            self.wakeup.set()
+
+    def _remember(self, key: str):
+        self.known[key] = None
+        if len(self.known) > ARCHIVE_KNOWN_MAX:
+            self.known.popitem(last=False)
+
+    def _write(self, batch: List[Tuple[str, str, Dict[str, Any]]]):
+        with self._lock:
+            db = self._conn()
+            with db:
+                for key, topic, it in batch:
+                    cur = db.execute(
+                        "INSERT OR IGNORE INTO items(url_key, topic, title, summary, url, image, added) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, topic, it.get("title") or "", it.get("summary") or "",
+                         it.get("url") or "", it.get("image") or "", now_ts()),
+                    )
+                    if cur.rowcount:
+                        db.execute(
+                            "INSERT INTO items_fts(rowid, title, summary, topic) VALUES (?, ?, ?, ?)",
+                            (cur.lastrowid, " ".join(stem_text(it.get("title") or "")),
+                             " ".join(stem_text(it.get("summary") or "")), topic),
+                        )
+
+    async def flush(self):
+        batch, self.pending = self.pending, []
+        if batch:
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception:
+                log.exception("архив: не удалось записать %d карточек", len(batch))
+                for key, _, _ in batch:  # пусть попробуют записаться в следующий раз
+                    self.known.pop(key, None)
 
-    return out[:limit]
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=ARCHIVE_FLUSH_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def _search(self, q: str, topic: str, limit: int) -> List[Dict[str, Any]]:
+        terms = [t.replace('"', "") for t in stem_text(q)]
+        terms = [t for t in terms if t]
+        if not terms:
+            return []
+        match = " AND ".join(f'"{t}"' for t in terms)
+        topic = re.sub(r"\W", "", topic)
+        if topic:
+            match = f'({match}) AND topic:"{topic}"'
+        with self._lock:
+            rows = self._conn().execute(
+                """
+                WITH hits AS (
+                    SELECT rowid, rank FROM items_fts WHERE items_fts MATCH ? ORDER BY rank LIMIT ?
+                )
+                SELECT i.topic, i.title, i.summary, i.url, i.image, i.added
+                FROM hits JOIN items i ON i.id = hits.rowid
+                ORDER BY hits.rank
+                """,
+                (match, limit),
+            ).fetchall()
+        keys = ("topic", "title", "summary", "url", "image", "added")
+        return [dict(zip(keys, row)) for row in rows]
+
+    async def search(self, q: str, topic: str = "", limit: int = 20) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._search, q, topic, limit)
+
+
+ARCHIVE = Archive(ARCHIVE_DB)
+
+# ----------------------- СТАТИКА -----------------------
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+mimetypes.add_type("text/javascript", ".js")
+
+def encode_variants(body: bytes, media_type: str) -> Dict[str, Any]:
+    """Тело + заранее сжатые варианты (gzip всегда, br — если есть модуль) и ETag по содержимому."""
+    digest = hashlib.sha256(body).hexdigest()[:16]
+    rec: Dict[str, Any] = {"media_type": media_type, "hash": digest, "identity": body}
+    if media_type.split(";")[0] in COMPRESSIBLE_TYPES and len(body) >= COMPRESS_MIN_BYTES:
+        rec["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            rec["br"] = brotli.compress(body, quality=11)
+    return rec
+
+def _accepted_encodings(header: str) -> set:
+    out = set()
+    for part in header.lower().split(","):
+        name, _, params = part.partition(";")
+        if re.fullmatch(r"\s*q\s*=\s*0(\.0*)?\s*", params):
+            continue  # q=0 — клиент явно отказался
+        out.add(name.strip())
+    return out
+
+def encoded_response(request: Request, rec: Dict[str, Any], cache_control: str) -> Response:
+    """Лучший вариант под Accept-Encoding; If-None-Match с тем же содержимым — 304 без тела."""
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding = next((e for e in ("br", "gzip") if e in rec and e in accepted), "")
+    etag = f'"{rec["hash"]}-{encoding}"' if encoding else f'"{rec["hash"]}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if rec["hash"] in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(rec[encoding or "identity"], media_type=rec["media_type"], headers=headers)
+
+
+class StaticAssets:
+    """Вся статика в памяти: хэш содержимого для версионных URL и готовые сжатые варианты.
+
+    Файлов немного и они маленькие, поэтому читаем и жмём один раз при старте,
+    а не на каждый запрос.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        files = {}
+        if not os.path.isdir(self.directory):
+            log.warning("static: каталог %s не найден", self.directory)
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, self.directory).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    body = f.read()
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                files[rel] = encode_variants(body, media_type)
+        self.files = files
+
+    def url(self, path: str) -> str:
+        """/static/<path>?v=<хэш> — меняется вместе с содержимым, поэтому можно кэшировать навсегда."""
+        rec = self.files.get(path)
+        return f"/static/{path}?v={rec['hash']}" if rec else f"/static/{path}"
+
+    def response(self, request: Request, path: str) -> Response:
+        rec = self.files.get(path)
+        if rec is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        versioned = request.query_params.get("v") == rec["hash"]
+        return encoded_response(request, rec, STATIC_IMMUTABLE if versioned else STATIC_REVALIDATE)
+
+
+STATIC = StaticAssets(STATIC_DIR)
+
+def thumb_url(url: str, width: int) -> str:
+    return f"{url}&w={width}&h={round(width * THUMB_RATIO)}"
+
+def thumb_srcset(url: str) -> str:
+    return ", ".join(f"{thumb_url(url, w)} {w}w" for w in THUMB_WIDTHS)
 
 # ----------------------- HTML (UI) -----------------------
-INDEX_HTML = f"""
-<!doctype html>
+TOPIC_CARDS = [
+    ("afisha", "Афиша Москвы"),
+    ("series", "Сериалы (за 6 мес, ≥7.5)"),
+    ("movies", "Фильмы (за 6 мес, ≥7.5)"),
+    ("agro", "Агро-бизнес"),
+    ("svo", "Новости СВО"),
+    ("ai", "Новости ИИ"),
+]
+
+def _topic_card(i: int, key: str, title: str) -> str:
+    # первая карточка видна сразу — грузим её в приоритете, остальные лениво
+    loading = 'fetchpriority="high"' if i == 0 else 'loading="lazy"'
+    src = TOPIC_IMAGES[key]
+    return f"""    <div class="card" onclick="openTopic('{key}')">
+      <img class="thumb" src="{thumb_url(src, 800)}" srcset="{thumb_srcset(src)}"
+           sizes="(min-width: 640px) 33vw, 100vw" width="800" height="300" {loading} decoding="async" alt="">
+      <div class="title">{html.escape(title)}</div>
+    </div>"""
+
+def render_index(day: datetime) -> str:
+    """Главная собирается один раз на день (в шапке дата), а не на каждый запрос."""
+    cards = "\n".join(_topic_card(i, key, title) for i, (key, title) in enumerate(TOPIC_CARDS))
+    return f"""<!doctype html>
 <html lang="ru">
 <head>
   <meta charset="utf-8" />
@@ -712,14 +1659,15 @@ INDEX_HTML = f"""
   <meta name="apple-mobile-web-app-capable" content="yes">
   <meta name="apple-mobile-web-app-status-bar-style" content="black-translucent">
   <meta name="apple-mobile-web-app-title" content="Моя подборка">
-  <link rel="manifest" href="/static/manifest.webmanifest">
+  <link rel="manifest" href="{STATIC.url('manifest.webmanifest')}">
+  <link rel="preconnect" href="https://images.unsplash.com">
 
   <!-- Иконки -->
-  <link rel="apple-touch-icon" sizes="180x180" href="/static/icons/apple-touch-icon.png">
-  <link rel="icon" type="image/png" sizes="192x192" href="/static/icons/android-chrome-192x192.png">
-  <link rel="icon" type="image/png" sizes="512x512" href="/static/icons/android-chrome-512x512.png">
-  <link rel="icon" type="image/png" sizes="32x32" href="/static/icons/favicon-32x32.png">
-  <link rel="icon" type="image/png" sizes="16x16" href="/static/icons/favicon-16x16.png">
+  <link rel="apple-touch-icon" sizes="180x180" href="{STATIC.url('icons/apple-touch-icon.png')}">
+  <link rel="icon" type="image/png" sizes="192x192" href="{STATIC.url('icons/android-chrome-192x192.png')}">
+  <link rel="icon" type="image/png" sizes="512x512" href="{STATIC.url('icons/android-chrome-512x512.png')}">
+  <link rel="icon" type="image/png" sizes="32x32" href="{STATIC.url('icons/favicon-32x32.png')}">
+  <link rel="icon" type="image/png" sizes="16x16" href="{STATIC.url('icons/favicon-16x16.png')}">
 
   <style>
     :root {{
@@ -768,76 +1716,120 @@ INDEX_HTML = f"""
   </style>
 </head>
 <body>
-  <h1>{datetime.now(MSK_TZ).strftime("%d %B %Y")}</h1>
+  <h1>{day.strftime("%d %B %Y")}</h1>
 
   <!-- Кнопка установки и подсказка -->
   <button id="installBtn" class="install-btn">📲 Установить</button>
   <div id="installHint" class="install-hint">Нажмите «Установить», чтобы добавить на экран</div>
 
   <div class="grid">
-    <div class="card" onclick="openTopic('afisha')">
-      <img class="thumb" src="{TOPIC_IMAGES['afisha']}" alt="">
-      <div class="title">Афиша Москвы</div>
-    </div>
-    <div class="card" onclick="openTopic('series')">
-      <img class="thumb" src="{TOPIC_IMAGES['series']}" alt="">
-      <div class="title">Сериалы (за 6 мес, ≥7.5)</div>
-    </div>
-    <div class="card" onclick="openTopic('movies')">
-      <img class="thumb" src="{TOPIC_IMAGES['movies']}" alt="">
-      <div class="title">Фильмы (за 6 мес, ≥7.5)</div>
-    </div>
-    <div class="card" onclick="openTopic('agro')">
-      <img class="thumb" src="{TOPIC_IMAGES['agro']}" alt="">
-      <div class="title">Агро-бизнес</div>
-    </div>
-    <div class="card" onclick="openTopic('svo')">
-      <img class="thumb" src="{TOPIC_IMAGES['svo']}" alt="">
-      <div class="title">Новости СВО</div>
-    </div>
-    <div class="card" onclick="openTopic('ai')">
-      <img class="thumb" src="{TOPIC_IMAGES['ai']}" alt="">
-      <div class="title">Новости ИИ</div>
-    </div>
+{cards}
   </div>
 
   <div id="panel" class="hidden">
     <div id="output"></div>
+    <div id="more"></div>
   </div>
 
   <!-- Логика загрузки карточек -->
   <script>
+    // Текущая тема и курсор следующей страницы (null — пул закончился)
+    let currentTopic = null;
+    let nextCursor = null;
+    let loadingMore = false;
+
+    function el(tag, cls, text) {{
+      const node = document.createElement(tag);
+      if (cls) node.className = cls;
+      if (text) node.textContent = text;
+      return node;
+    }}
+
+    // Карточки собираем через DOM: без разбора HTML-строк, текст источников не исполняется как разметка
+    function renderItems(items) {{
+      const frag = document.createDocumentFragment();
+      items.forEach(function(it) {{
+        const item = el('div', 'item');
+        if (it.image) {{
+          const img = el('img', 'cover');
+          img.loading = 'lazy';
+          img.decoding = 'async';
+          img.width = 800;
+          img.height = 440;
+          img.alt = '';
+          img.src = it.image;
+          item.appendChild(img);
+        }}
+        const body = el('div', 'body');
+        body.appendChild(el('div', 'name', it.title || ''));
+        body.appendChild(el('p', 'desc', it.summary || ''));
+        if (it.url) {{
+          const a = el('a', 'btn', 'Подробнее →');
+          a.target = '_blank';
+          a.rel = 'noopener';
+          a.href = it.url;
+          body.appendChild(a);
+        }}
+        item.appendChild(body);
+        frag.appendChild(item);
+      }});
+      return frag;
+    }}
+
+    function showStatus(output, name, desc) {{
+      output.replaceChildren(renderItems([{{title: name, summary: desc}}]));
+    }}
+
+    async function fetchPage(key, cursor) {{
+      const r = await fetch('/data?topic=' + encodeURIComponent(key) + '&cursor=' + encodeURIComponent(cursor), {{
+        headers: {{'ngrok-skip-browser-warning': 'true'}}
+      }});
+      return await r.json();
+    }}
+
     async function openTopic(key) {{
       const panel = document.getElementById('panel');
       const output = document.getElementById('output');
       panel.classList.remove('hidden');
-      output.innerHTML = '<div class="item"><div class="body"><div class="name">Загрузка…</div><p class="desc">Получаю данные для: '+key+'</p></div></div>';
+      currentTopic = key;
+      nextCursor = null;
+      showStatus(output, 'Загрузка…', 'Получаю данные для: ' + key);
 
       try {{
-        const r = await fetch('/data?topic=' + encodeURIComponent(key), {{
-          headers: {{'ngrok-skip-browser-warning': 'true'}}
-        }});
-        const js = await r.json();
-        if (!Array.isArray(js) || js.length === 0) {{
-          output.innerHTML = '<div class="item"><div class="body"><div class="name">Пусто</div><p class="desc">Нет данных. Попробуйте позже.</p></div></div>';
+        const js = await fetchPage(key, '');
+        if (!js.items || js.items.length === 0) {{
+          showStatus(output, 'Пусто', 'Нет данных. Попробуйте позже.');
           return;
         }}
-        let html = '';
-        js.forEach(function(it) {{
-          html += '<div class="item">';
-          if (it.image) html += '<img class="cover" src="'+it.image+'" alt="">';
-          html += '<div class="body">';
-          html += '<div class="name">'+(it.title || '')+'</div>';
-          html += '<p class="desc">'+(it.summary || '')+'</p>';
-          if (it.url) html += '<a class="btn" target="_blank" rel="noopener" href="'+it.url+'">Подробнее →</a>';
-          html += '</div></div>';
-        }});
-        output.innerHTML = html;
+        output.replaceChildren(renderItems(js.items));
+        nextCursor = js.next_cursor;
       }} catch (e) {{
-        output.innerHTML = '<div class="item"><div class="body"><div class="name">Ошибка</div><p class="desc">Не удалось загрузить.</p></div></div>';
+        showStatus(output, 'Ошибка', 'Не удалось загрузить.');
       }}
       window.scrollTo({{top: panel.offsetTop - 8, behavior: 'smooth'}});
     }}
+
+    // Догружаем следующую страницу из кэша сервера, когда низ списка показался на экране
+    async function loadMore() {{
+      if (!nextCursor || loadingMore) return;
+      loadingMore = true;
+      const key = currentTopic;
+      try {{
+        const js = await fetchPage(key, nextCursor);
+        if (key !== currentTopic) return;  // пока грузили, открыли другую тему
+        const output = document.getElementById('output');
+        if (js.restart) output.replaceChildren();  // пул обновился — листаем новый с начала
+        output.appendChild(renderItems(js.items || []));
+        nextCursor = js.next_cursor;
+      }} catch (e) {{
+        nextCursor = null;
+      }} finally {{
+        loadingMore = false;
+      }}
+    }}
+    new IntersectionObserver(function(entries) {{
+      if (entries.some(function(e) {{ return e.isIntersecting; }})) loadMore();
+    }}, {{rootMargin: '600px'}}).observe(document.getElementById('more'));
   </script>
 
   <!-- PWA: кнопка установки + SW -->
@@ -866,10 +1858,13 @@ INDEX_HTML = f"""
       console.log(outcome === 'accepted' ? 'Установлено ✅' : 'Отменено ❌');
     }});
 
-    // Регистрация Service Worker
+    // Регистрация Service Worker: с корня, иначе его область — только /static/ и главную он не видит
     if ('serviceWorker' in navigator) {{
       window.addEventListener('load', () => {{
-        navigator.serviceWorker.register('/static/sw.js')
+        navigator.serviceWorker.getRegistrations().then((regs) => regs.forEach((reg) => {{
+          if (new URL(reg.scope).pathname === '/static/') reg.unregister();  // старая регистрация
+        }}));
+        navigator.serviceWorker.register('/sw.js', {{scope: '/'}})
           .then(reg => console.log('✅ Service Worker зарегистрирован:', reg))
           .catch(err => console.log('❌ Ошибка регистрации Service Worker:', err));
       }});
@@ -879,39 +1874,231 @@ INDEX_HTML = f"""
 </html>
 """
 
+# Готовая главная (тело + gzip/br) на текущий день по МСК
+INDEX: Dict[str, Any] = {}
+
+def index_page() -> Dict[str, Any]:
+    day = datetime.now(MSK_TZ)
+    if INDEX.get("day") != day.date():
+        INDEX.clear()
+        INDEX.update(encode_variants(render_index(day).encode(), "text/html; charset=utf-8"), day=day.date())
+    return INDEX
+
 # ----------------------- ROUTES -----------------------
+@app.on_event("startup")
+async def on_startup():
+    index_page()
+    app.state.archive_task = asyncio.create_task(ARCHIVE.run())
+    app.state.prewarm_task = asyncio.create_task(prewarm()) if PREWARM else None
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if app.state.prewarm_task:
+        app.state.prewarm_task.cancel()
+    app.state.archive_task.cancel()
+    await ARCHIVE.flush()
+    await http_client().aclose()
+
 @app.get("/", response_class=HTMLResponse)
-async def index() -> HTMLResponse:
-    return HTMLResponse(INDEX_HTML)
+async def index(request: Request) -> Response:
+    # Всегда ревалидируем: дата в шапке меняется, а 304 по ETag почти ничего не стоит
+    return encoded_response(request, index_page(), STATIC_REVALIDATE)
+
+# Service Worker отдаём с корня: его область по умолчанию — каталог скрипта
+@app.get("/sw.js")
+async def service_worker(request: Request) -> Response:
+    return STATIC.response(request, "sw.js")
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def static_file(request: Request, path: str) -> Response:
+    return STATIC.response(request, path)
+
+async def collect_topic(topic: str, force: bool = False) -> List[Dict[str, Any]]:
+    """Весь отфильтрованный пул темы (без лимита) — он целиком ложится в кэш."""
+    spec = TOPICS.get(topic)
+    if spec is None:
+        return []
+    try:
+        return await run_pipeline(topic, spec, force)
+    except Exception:
+        log.exception("%s: пайплайн упал", topic)
+        PIPELINE_STATS[topic] = {"ts": now_ts(), "items": 0, "failed": ["pipeline"]}
+        return []
+
+# Обновления тем, которые идут прямо сейчас: второй запрос ждёт первый, а не скрейпит заново
+# topic -> (задача, force)
+INFLIGHT: Dict[str, Tuple[asyncio.Task, bool]] = {}
+# Номер последнего обновления, уже записанного в кэш: более раннее не затирает более позднее
+_refresh_seq = itertools.count(1)
+APPLIED_SEQ: Dict[str, int] = {}
+
+async def _refresh(topic: str, force: bool = False, seq: int = 0) -> Tuple[str, List[Dict[str, Any]]]:
+    # обновление из /data пишет в трейс запроса; фоновое — в свой, если TRACE=1
+    own = start_trace("refresh", topic=topic) if TRACE_ENABLED and CURRENT_TRACE.get() is None else None
+    pool = await collect_topic(topic, force)
+    if APPLIED_SEQ.get(topic, 0) > seq:
+        # пока собирали, более позднее обновление (force=1) уже легло в кэш — оно свежее
+        ARCHIVE.add(topic, pool)
+        if own is not None:
+            finish_trace(own)
+        return cache_pool(topic, "")
+    APPLIED_SEQ[topic] = seq
+    with span("cache_set", topic=topic):
+        version = cache_set(topic, pool)
+    ARCHIVE.add(topic, pool)
+    if own is not None:
+        finish_trace(own)
+    return version, pool
+
+def _forget_inflight(topic: str, task: asyncio.Task):
+    entry = INFLIGHT.get(topic)
+    if entry is not None and entry[0] is task:
+        del INFLIGHT[topic]
+
+async def refresh_topic(topic: str, force: bool = False) -> Tuple[str, List[Dict[str, Any]]]:
+    """Собрать тему и положить в кэш; параллельные вызовы делят одно обновление.
+
+    force=1 к идущему обычному обновлению не присоединяется: то могло взять прошлые
+    результаты источников и стоит в очереди хостов с фоновым приоритетом. Запускаем своё
+    в контексте вызывающего (с его FETCH_PRIORITY); дальнейшие вызовы ждут уже его.
+    """
+    entry = INFLIGHT.get(topic)
+    if entry is None or (force and not entry[1]):
+        task = asyncio.create_task(_refresh(topic, force, next(_refresh_seq)))
+        task.add_done_callback(lambda t: _forget_inflight(topic, t))
+        entry = INFLIGHT[topic] = (task, force)
+    # shield: отвалившийся клиент не отменяет общее обновление
+    return await asyncio.shield(entry[0])
+
+async def prewarm():
+    """Фоновый прогрев всех тем после старта — первый тап отвечает уже из кэша."""
+    FETCH_PRIORITY.set(PRIORITY_BACKGROUND)
+    started = time.perf_counter()
+    await asyncio.gather(*(refresh_topic(t) for t in TOPICS), return_exceptions=True)
+    log.info("кэш прогрет: %d тем за %.1f с", len(TOPICS), time.perf_counter() - started)
+
+def topic_warm(topic: str) -> Tuple[bool, List[str]]:
+    """(тёплая ли тема, упавшие источники пустой выдачи).
+
+    Тёплая — первый тап ответит из кэша: в пуле есть карточки, либо пул честно пуст
+    (все источники ответили, фильтр всё отсеял) и его TTL ещё идёт. Пустой пул из-за
+    упавших источников cache_get считает промахом — такая тема не тёплая.
+    """
+    rec = CACHE.get(topic)
+    if rec is None:
+        return False, []
+    if rec["items"]:
+        return True, []
+    failed = PIPELINE_STATS.get(topic, {}).get("failed") or []
+    if failed:
+        return False, failed
+    return now_ts() - rec["ts"] <= (rec.get("ttl") or get_ttl(topic)), []
+
+# Готовность отдавать из кэша (в отличие от /health — «процесс жив»)
+@app.get("/ready", response_class=JSONResponse)
+async def ready() -> JSONResponse:
+    topics: Dict[str, Any] = {}
+    for topic in TOPICS:
+        rec = CACHE.get(topic)
+        warm, failed = topic_warm(topic)
+        topics[topic] = {
+            "warm": warm,
+            "failed": failed,
+            "refreshing": topic in INFLIGHT,
+            "items": len(rec["items"]) if rec else 0,
+            "age": now_ts() - rec["ts"] if rec else None,
+            "stages_ms": PIPELINE_STATS.get(topic, {}).get("stages"),
+        }
+    is_ready = all(t["warm"] for t in topics.values())
+    body = {
+        "ready": is_ready,
+        "failed": [topic for topic, t in topics.items() if t["failed"]],
+        "topics": topics,
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
-# ===== ОБНОВЛЕНО: добавлен параметр force=1 для обхода кэша =====
+# ===== force=1 — обход кэша; cursor — постраничная выдача из пула без запросов наружу =====
 @app.get("/data", response_class=JSONResponse)
-async def data(topic: str = Query(...), force: int = Query(0)) -> JSONResponse:
+async def data(
+    topic: str = Query(...),
+    force: int = Query(0),
+    cursor: str | None = Query(None),
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    debug: int = Query(0),
+) -> JSONResponse:
     topic = (topic or "").lower().strip()
-
-    if not force:
-        cached = cache_get(topic)
-        if cached is not None:
-            return JSONResponse(cached)
-
-    items: List[Dict[str, Any]] = []
+    if force:
+        FETCH_PRIORITY.set(PRIORITY_USER)
+    trace = start_trace("data", topic=topic) if debug or TRACE_ENABLED else None
+    page_size = limit or TOPIC_PAGE_SIZE.get(topic, DEFAULT_PAGE_SIZE)
+
+    wanted, offset = parse_cursor(cursor) if cursor else ("", 0)
+    with span("cache_get", topic=topic):
+        cached = None if force else cache_get(topic)
+    if not force and wanted and topic in CACHE:
+        # продолжение листания — из того пула, по которому выдан курсор (O(1) по версии)
+        version, pool = cache_pool(topic, wanted)
+    elif cached is not None:
+        version, pool = cache_pool(topic, "")
+    elif topic in TOPICS:
+        version, pool = await refresh_topic(topic, bool(force))
+    else:
+        version, pool = "", []
+
+    if cursor is None:
+        payload: Any = pool[:page_size]
+    else:
+        # пул курсора уже вытеснен (или force=1 собрал новый): старое смещение в новом пуле
+        # пропустит или повторит карточки — отдаём новый пул с начала, клиент начинает список заново
+        restart = bool(wanted) and wanted != version
+        if restart:
+            offset = 0
+        page = pool[offset:offset + page_size]
+        end = offset + len(page)
+        payload = {
+            "items": page,
+            "next_cursor": make_cursor(version, end) if end < len(pool) else None,
+            "restart": restart,
+        }
+    if trace is not None:
+        finish_trace(trace)
+        if debug:
+            return JSONResponse({"data": payload, "trace": trace})
+    return JSONResponse(payload)
+
+# Пул темы только из кэша — никогда не скрейпит (для бота); ETag = версия пула
+@app.get("/cache/{topic}", response_class=JSONResponse)
+async def cache_snapshot(topic: str, request: Request) -> Response:
+    rec = CACHE.get(topic.lower().strip()) or {}
+    version = rec.get("version", "")
+    etag = f'"{version}"'
+    if version and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    body = {"version": version, "ts": rec.get("ts", 0), "items": rec.get("items") or []}
+    return JSONResponse(body, headers={"ETag": etag} if version else None)
+
+# Последние N трейсов (новые первыми); format=text — водопад для глаз
+@app.get("/debug/traces")
+async def debug_traces(
+    limit: int = Query(10, ge=1, le=TRACE_BUFFER),
+    topic: str = Query(""),
+    format: str = Query("json"),
+):
+    traces = [t for t in reversed(TRACES) if not topic or t.get("topic") == topic][:limit]
+    if format == "text":
+        return PlainTextResponse("\n\n".join(render_waterfall(t) for t in traces) or "трейсов нет")
+    return JSONResponse(traces)
+
+# Поиск по архиву всех когда-либо собранных карточек
+@app.get("/search", response_class=JSONResponse)
+async def search(
+    q: str = Query(..., min_length=2),
+    topic: str = Query(""),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+) -> JSONResponse:
     try:
-        if topic == "afisha":
-            items = await get_afisha(limit=10)
-        elif topic == "series":
-            items = await get_series(limit=5)
-        elif topic == "movies":
-            items = await get_movies(limit=5)
-        elif topic == "agro":
-            items = await get_agro(limit=10)
-        elif topic == "svo":
-            items = await get_svo(limit=10)
-        elif topic == "ai":
-            items = await get_ai_news(limit=10)
-        else:
-            items = []
+        items = await ARCHIVE.search(q, (topic or "").lower().strip(), limit)
     except Exception:
+        log.exception("поиск по архиву: %r", q)
         items = []
-
-    cache_set(topic, items)
-    return JSONResponse(items)
\ No newline at end of file
+    return JSONResponse(items)
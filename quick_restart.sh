@@ -16,6 +16,12 @@ if ! curl -sI http://127.0.0.1:8000/ | head -1 | grep -q 200; then
   exit 1
 fi
 
+# ждём прогрева кэша (/ready), иначе первый тап по каждой карточке — холодный скрейп
+for _ in $(seq 1 "${READY_TIMEOUT:-90}"); do
+  curl -sf http://127.0.0.1:8000/ready >/dev/null 2>&1 && break
+  sleep 1
+done
+
 # 3) поднимаем ngrok и берём публичный URL
 ngrok http 8000 > /tmp/ngrok.log 2>&1 &
 sleep 2
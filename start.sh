@@ -23,6 +23,13 @@ uvicorn main:app --port 8000 --reload > /tmp/uvicorn.log 2>&1 &
 UV_PID=$!
 sleep 1
 
+# 3.1) Ждём прогрева кэша, чтобы туннель смотрел на инстанс, который уже отвечает из кэша
+echo "⏳ Жду прогрева кэша (/ready)…"
+for _ in $(seq 1 "${READY_TIMEOUT:-90}"); do
+  curl -sf http://127.0.0.1:8000/ready >/dev/null 2>&1 && { echo "✅ Кэш прогрет"; break; }
+  sleep 1
+done
+
 # 4) Стартуем ngrok в фоне и берём публичный URL
 echo "▶️  Запускаю ngrok…"
 ngrok http 8000 > /tmp/ngrok.log 2>&1 &
@@ -1,7 +1,11 @@
+// Версионные URL (/static/…?v=хэш) неизменны — их отдаём из кэша;
+// главную и всё прочее — сначала из сети (дата и разметка обновляются), кэш только без сети.
+const CACHE = 'v3';
+
 self.addEventListener('install', (event) => {
   console.log('⚡ Service Worker установлен');
   event.waitUntil(
-    caches.open('v1').then((cache) => {
+    caches.open(CACHE).then((cache) => {
       return cache.addAll([
         '/',                 // главная страница
         '/static/manifest.webmanifest',
@@ -15,10 +19,59 @@ self.addEventListener('install', (event) => {
   );
 });
 
+self.addEventListener('activate', (event) => {
+  // старые кэши (v1 держал главную навсегда) больше не нужны
+  event.waitUntil(
+    caches.keys().then((keys) => Promise.all(
+      keys.filter((key) => key !== CACHE).map((key) => caches.delete(key))
+    ))
+  );
+});
+
 self.addEventListener('fetch', (event) => {
+  const req = event.request;
+  if (req.method !== 'GET') return;
+
+  if (req.mode === 'navigate') {
+    event.respondWith(
+      fetch(req)
+        .then((response) => {
+          if (response.ok) {
+            const copy = response.clone();
+            caches.open(CACHE).then((cache) => cache.put('/', copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match('/'))
+    );
+    return;
+  }
+
+  const url = new URL(req.url);
+  if (url.pathname.startsWith('/static/') && url.searchParams.has('v')) {
+    event.respondWith(
+      caches.match(req).then((cached) => cached || fetch(req).then((response) => {
+        if (response.ok) {
+          const copy = response.clone();
+          caches.open(CACHE).then((cache) => cache.put(req, copy));
+        }
+        return response;
+      }))
+    );
+    return;
+  }
+
+  // Остальное (в т.ч. /static/ без ?v= из precache) — сначала сеть: сервер отдаёт такие URL
+  // с ревалидацией, и кэш-первым они не обновились бы до смены CACHE; кэш — только без сети
   event.respondWith(
-    caches.match(event.request).then((response) => {
-      return response || fetch(event.request);
-    })
+    fetch(req)
+      .then((response) => {
+        if (response.ok && url.pathname.startsWith('/static/')) {
+          const copy = response.clone();
+          caches.open(CACHE).then((cache) => cache.put(req, copy));
+        }
+        return response;
+      })
+      .catch(() => caches.match(req))
   );
 });
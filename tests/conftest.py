@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py лежит в app/ и ищет static/ от текущего каталога — как при запуске из корня
+sys.path.insert(0, os.path.join(ROOT, "app"))
+os.chdir(ROOT)
+os.environ.setdefault("PREWARM", "0")
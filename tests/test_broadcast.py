@@ -0,0 +1,175 @@
+import asyncio
+import os
+
+os.environ.setdefault("BOT_TOKEN", "123456:test-token")
+os.environ.setdefault("SUBSCRIBERS_DB", ":memory:")
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+import bot  # noqa: E402
+
+
+class FakeBot:
+    """send_message по сценарию: chat_id -> исключение (или список исключений по попыткам)."""
+
+    def __init__(self, script):
+        self.script = script
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        method = SendMessage(chat_id=chat_id, text=text)
+        outcome = self.script.get(chat_id)
+        if isinstance(outcome, list):
+            outcome = outcome.pop(0) if outcome else None
+        if outcome is not None:
+            raise outcome(method)
+        self.sent.append((chat_id, text))
+
+
+def _bad_request(message):
+    return lambda method: TelegramBadRequest(method=method, message=message)
+
+
+def _broadcast(monkeypatch, script, chat_ids, parts=("digest",)):
+    monkeypatch.setattr(bot, "PER_CHAT_INTERVAL", 0)
+    store = bot.SubscriberStore(":memory:")
+    for chat_id in chat_ids:
+        store.add(chat_id)
+    fake = FakeBot(script)
+    stats = asyncio.run(bot.Broadcaster(fake, store).send(list(parts), store.all()))
+    return stats, store.all(), fake
+
+
+def test_own_bad_request_keeps_subscriber(monkeypatch):
+    stats, left, _ = _broadcast(monkeypatch, {
+        4: _bad_request("Bad Request: can't parse entities: unsupported start tag"),
+        5: _bad_request("Bad Request: message is too long"),
+    }, [1, 4, 5])
+    assert stats == {"sent": 1, "failed": 2, "unsubscribed": 0}
+    assert left == [1, 4, 5]
+
+
+def test_gone_chats_are_unsubscribed(monkeypatch):
+    stats, left, _ = _broadcast(monkeypatch, {
+        2: lambda method: TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user"),
+        3: _bad_request("Bad Request: chat not found"),
+    }, [1, 2, 3])
+    assert stats == {"sent": 1, "failed": 0, "unsubscribed": 2}
+    assert left == [1]
+
+
+def test_retry_after_is_retried(monkeypatch):
+    flood = lambda method: TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)  # noqa: E731
+    stats, left, fake = _broadcast(monkeypatch, {7: [flood]}, [7, 8], parts=("one", "two"))
+    assert stats == {"sent": 2, "failed": 0, "unsubscribed": 0}
+    assert sorted(fake.sent) == [(7, "one"), (7, "two"), (8, "one"), (8, "two")]
+
+
+def test_pack_messages_respects_limit(monkeypatch):
+    monkeypatch.setattr(bot, "MESSAGE_LIMIT", 100)
+    line = "• <a href=\"https://e.test/x\">заголовок</a>"
+    block = "\n\n".join(["<b>Тема</b>"] + [line] * 5)
+    parts = bot.pack_messages(["<b>Подборка</b>", block, "x" * 150])
+    assert parts and all(len(p) <= 100 for p in parts)
+    # строки не рвём: каждая строка блока целиком попала в какую-то часть
+    assert sum(p.count(line) for p in parts) == 5
+
+
+def test_broadcast_through_local_bot_api_server(monkeypatch):
+    """Настоящий HTTP: AiohttpSession + TelegramAPIServer.from_base против локального фейка Bot API."""
+    from aiohttp import web
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    monkeypatch.setattr(bot, "PER_CHAT_INTERVAL", 0)
+    hits: dict = {}
+
+    async def send_message(request):
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        hits[chat_id] = hits.get(chat_id, 0) + 1
+        if chat_id == 2:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, status=403)
+        if chat_id == 3:
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": "Bad Request: can't parse entities"}, status=400)
+        if chat_id == 4:
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}, status=400)
+        if chat_id == 5 and hits[chat_id] == 1:
+            return web.json_response({
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            }, status=429)
+        return web.json_response({"ok": True, "result": {
+            "message_id": hits[chat_id], "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": data["text"],
+        }})
+
+    async def go():
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", send_message)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+        real_bot = Bot(token="123456:test-token", session=session)
+        store = bot.SubscriberStore(":memory:")
+        for chat_id in (1, 2, 3, 4, 5):
+            store.add(chat_id)
+        try:
+            stats = await bot.Broadcaster(real_bot, store).send(["<b>Дайджест</b>"], store.all())
+        finally:
+            await session.close()
+            await runner.cleanup()
+        return stats, store.all()
+
+    stats, left = asyncio.run(go())
+    assert stats == {"sent": 2, "failed": 1, "unsubscribed": 2}
+    assert left == [1, 3, 5]  # 403 и «chat not found» отписаны, наша ошибка разметки — нет
+    assert hits[5] == 2  # 429 с retry_after — повторили
+
+
+def test_digest_refreshes_stale_topics(monkeypatch):
+    import httpx
+    from datetime import datetime
+
+    today = int(datetime.now(bot.MSK_TZ).timestamp())
+    yesterday = today - 86400 - 3600
+    pools = {"afisha": today, "ai": yesterday, "agro": yesterday}
+    forced = []
+
+    def handler(request):
+        path = request.url.path
+        if path == "/data":
+            topic = request.url.params["topic"]
+            forced.append((topic, request.url.params.get("force")))
+            if topic == "agro":
+                return httpx.Response(502)
+            pools[topic] = today
+            return httpx.Response(200, json=[])
+        topic = path.rsplit("/", 1)[-1]
+        ts = pools.get(topic)
+        if ts is None:
+            return httpx.Response(200, json={"version": "", "ts": 0, "items": []})
+        version = f"{topic}-{ts}"
+        items = [{"title": f"{topic} {ts}", "url": f"https://e.test/{topic}"}]
+        return httpx.Response(200, json={"version": version, "ts": ts, "items": items}, headers={"ETag": f'"{version}"'})
+
+    monkeypatch.setattr(bot, "RENDERED", {})
+    monkeypatch.setattr(bot, "API_URL", "http://api.test")
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await bot.refresh_digest_topics(client)
+
+    asyncio.run(go())
+    assert sorted(forced) == [("agro", "1"), ("ai", "1")]
+    parts = bot.render_digest()
+    text = "\n".join(parts)
+    assert f"afisha {today}" in text and f"ai {today}" in text
+    assert "agro" not in text  # обновить не вышло — вчерашнюю подборку не шлём
@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _pool(tag: str, n: int = 25):
+    return [{"title": f"{tag} {i}", "summary": "", "url": f"https://e.test/{tag}/{i}", "image": ""} for i in range(n)]
+
+
+def _page(client: TestClient, cursor: str, limit: int = 10):
+    r = client.get("/data", params={"topic": "ai", "cursor": cursor, "limit": limit})
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_cursor_pages_through_one_pool(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    main.cache_set("ai", _pool("a"))
+    client = TestClient(main.app)
+    first = _page(client, "")
+    second = _page(client, first["next_cursor"])
+    assert [it["title"] for it in first["items"] + second["items"]] == [f"a {i}" for i in range(20)]
+    assert not second["restart"]
+
+
+def test_cursor_keeps_previous_pool_after_refresh(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    main.cache_set("ai", _pool("a"))
+    client = TestClient(main.app)
+    cursor = _page(client, "")["next_cursor"]
+    main.cache_set("ai", _pool("b", 30))
+    page = _page(client, cursor)
+    assert page["items"][0]["title"] == "a 10"
+    assert not page["restart"]
+
+
+def test_evicted_cursor_restarts_from_zero(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    main.cache_set("ai", _pool("c"))
+    client = TestClient(main.app)
+    page = _page(client, "gone:10")
+    assert page["restart"]
+    assert page["items"][0]["title"] == "c 0"
+    assert page["next_cursor"] == main.make_cursor(main.CACHE["ai"]["version"], 10)
+
+
+def test_force_with_cursor_restarts(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    main.cache_set("ai", _pool("a"))
+
+    async def fake_refresh(topic, force=False):
+        return main.cache_set(topic, _pool("fresh", 30)), main.CACHE[topic]["items"]
+
+    monkeypatch.setattr(main, "refresh_topic", fake_refresh)
+    client = TestClient(main.app)
+    cursor = _page(client, "")["next_cursor"]
+    r = client.get("/data", params={"topic": "ai", "cursor": cursor, "limit": 10, "force": 1})
+    page = r.json()
+    assert page["restart"]
+    assert page["items"][0]["title"] == "fresh 0"
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def fast_outbound(monkeypatch):
+    monkeypatch.setattr(main, "OUTBOUND", main.OutboundScheduler({}, (100.0, 10, 4)))
+
+
+def _streamed(chunks, served: list, headers=None):
+    """Ответ, тело которого отдаётся по кускам; served — сколько кусков реально забрали."""
+
+    async def body():
+        for chunk in chunks:
+            served.append(len(chunk))
+            yield chunk
+
+    def handler(request):
+        return httpx.Response(200, headers=headers or {"Content-Type": "text/html; charset=utf-8"}, content=body())
+
+    return handler
+
+
+def _fetch(handler, url, **kwargs):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main.fetch_links(client, url, **kwargs)
+
+    return asyncio.run(go())
+
+
+def test_stops_reading_at_anchor_limit():
+    served: list = []
+    chunks = [f'<p><a href="/n/{i}">Новость номер {i}</a></p>'.encode() for i in range(10_000)]
+    links = _fetch(_streamed(chunks, served), "https://site.test/", limit=main.MAX_ANCHORS)
+    assert len(links) == main.MAX_ANCHORS
+    assert links[0] == ("Новость номер 0", "/n/0")
+    assert len(served) <= main.MAX_ANCHORS + 2  # дальше тело не качали
+
+
+def test_stops_reading_at_host_byte_cap(monkeypatch):
+    monkeypatch.setitem(main.SOURCE_MAX_BYTES, "heavy.test", 8 * 1024)
+    served: list = []
+    chunks = [b'<div>' + b"x" * 1019 + b"</div>"] * 1000 + ['<a href="/late">Поздняя ссылка</a>'.encode()]
+    links = _fetch(_streamed(chunks, served), "https://heavy.test/")
+    assert links == []
+    assert sum(served) <= 8 * 1024 + 1024
+
+
+def test_decodes_multibyte_split_across_chunks():
+    raw = '<a href="/ru">Урожай пшеницы</a>'.encode("utf-8")
+    cut = raw.index("ж".encode()) + 1  # режем посреди двухбайтной буквы
+    links = _fetch(_streamed([raw[:cut], raw[cut:]], []), "https://site.test/")
+    assert links == [("Урожай пшеницы", "/ru")]
+
+
+def test_uses_declared_charset():
+    raw = '<a href="/cp">Экспорт зерна</a>'.encode("cp1251")
+    links = _fetch(_streamed([raw], [], {"Content-Type": "text/html; charset=windows-1251"}), "https://site.test/")
+    assert links == [("Экспорт зерна", "/cp")]
+
+
+def test_skips_script_and_style():
+    page = (
+        '<style>a:after { content: "<a href=\'/css\'>css</a>"; }</style>'
+        '<script>document.write("<a href=\'/js\'>js</a>");</script>'
+        '<a href="/real">Настоящая <b>ссылка</b></a>'
+    ).encode()
+    links = _fetch(_streamed([page], []), "https://site.test/")
+    assert links == [("Настоящая ссылка", "/real")]
+
+
+def test_collector_closes_unterminated_anchor():
+    parser = main.AnchorCollector(limit=5)
+    parser.feed('<a href="/a">Первая<a href="/b">Вторая</a>')
+    assert parser.links == [("Первая", "/a"), ("Вторая", "/b")]
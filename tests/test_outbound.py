@@ -0,0 +1,251 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+import main
+
+
+def _response(status: int, **headers) -> httpx.Response:
+    return httpx.Response(status, headers=headers)
+
+
+async def _grab(sched: main.OutboundScheduler, url: str, log: list, tag, hold: float = 0.0, priority=None):
+    if priority is not None:
+        main.FETCH_PRIORITY.set(priority)
+    async with sched.slot(url):
+        log.append((tag, time.monotonic()))
+        await asyncio.sleep(hold)
+
+
+def test_token_bucket_allows_burst_then_rate():
+    sched = main.OutboundScheduler({"h.test": (10.0, 2, 10)}, (1.0, 1, 1))
+    log: list = []
+
+    async def go():
+        started = time.monotonic()
+        await asyncio.gather(*(_grab(sched, "https://h.test/x", log, i) for i in range(5)))
+        return [t - started for _, t in log]
+
+    offsets = sorted(asyncio.run(go()))
+    assert offsets[1] < 0.05             # всплеск из burst=2 — сразу
+    assert offsets[2] >= 0.08            # дальше по 10/с
+    assert offsets[4] >= 0.28
+
+
+def test_concurrency_limit_per_host():
+    sched = main.OutboundScheduler({"h.test": (100.0, 10, 1)}, (1.0, 1, 1))
+    log: list = []
+
+    async def go():
+        await asyncio.gather(
+            _grab(sched, "https://h.test/a", log, "a", hold=0.2),
+            _grab(sched, "https://h.test/b", log, "b"),
+        )
+
+    asyncio.run(go())
+    (_, ta), (_, tb) = log
+    assert tb - ta >= 0.19
+
+
+def test_other_hosts_do_not_wait():
+    sched = main.OutboundScheduler({"slow.test": (100.0, 10, 1)}, (100.0, 10, 1))
+    log: list = []
+
+    async def go():
+        await asyncio.gather(
+            _grab(sched, "https://slow.test/a", log, "slow", hold=0.3),
+            _grab(sched, "https://fast.test/a", log, "fast"),
+        )
+
+    asyncio.run(go())
+    times = dict(log)
+    assert abs(times["fast"] - times["slow"]) < 0.1
+
+
+def test_priority_queue_serves_user_before_background():
+    sched = main.OutboundScheduler({"h.test": (100.0, 10, 1)}, (1.0, 1, 1))
+    log: list = []
+
+    async def go():
+        holder = asyncio.create_task(_grab(sched, "https://h.test/0", log, "holder", hold=0.1))
+        await asyncio.sleep(0.01)
+        # фоновый встал в очередь раньше, но пользовательский должен пройти первым
+        bg = asyncio.create_task(_grab(sched, "https://h.test/1", log, "bg", priority=main.PRIORITY_BACKGROUND))
+        await asyncio.sleep(0.01)
+        user = asyncio.create_task(_grab(sched, "https://h.test/2", log, "user", priority=main.PRIORITY_USER))
+        await asyncio.gather(holder, bg, user)
+
+    asyncio.run(go())
+    assert [tag for tag, _ in log] == ["holder", "user", "bg"]
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    sched = main.OutboundScheduler({"h.test": (100.0, 10, 1)}, (1.0, 1, 1))
+    log: list = []
+
+    async def go():
+        holder = asyncio.create_task(_grab(sched, "https://h.test/0", log, "holder", hold=0.05))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(_grab(sched, "https://h.test/1", log, "cancelled"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await holder
+        await asyncio.wait_for(_grab(sched, "https://h.test/2", log, "next"), timeout=1)
+
+    asyncio.run(go())
+    assert [tag for tag, _ in log] == ["holder", "next"]
+    assert sched.hosts["h.test"].active == 0
+
+
+def test_backoff_parses_retry_after():
+    sched = main.OutboundScheduler({}, (100.0, 10, 1))
+    url = "https://h.test/x"
+    assert sched.backoff(url, _response(200)) is None
+    assert sched.backoff(url, _response(429, **{"Retry-After": "7"})) == 7.0
+    assert sched.backoff(url, _response(503)) == float(main.RETRY_AFTER_DEFAULT)
+    when = datetime.now(timezone.utc) + timedelta(seconds=20)
+    delay = sched.backoff(url, _response(429, **{"Retry-After": format_datetime(when, usegmt=True)}))
+    assert 15 <= delay <= 21
+
+
+def test_retry_after_pauses_the_host():
+    sched = main.OutboundScheduler({"h.test": (100.0, 10, 2)}, (1.0, 1, 1))
+    log: list = []
+
+    async def go():
+        sched.backoff("https://h.test/x", _response(429, **{"Retry-After": "1"}))
+        started = time.monotonic()
+        await _grab(sched, "https://h.test/y", log, "after")
+        return log[0][1] - started
+
+    assert asyncio.run(go()) >= 0.9
+
+
+def test_attempt_retries_once_after_429(monkeypatch):
+    monkeypatch.setattr(main, "OUTBOUND", main.OutboundScheduler({}, (100.0, 10, 2)))
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        return httpx.Response(200, text="ok")
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main._attempt(client, "https://retry.test/page", main._read_text)
+
+    assert asyncio.run(go()) == "ok"
+    assert len(calls) == 2
+
+
+def test_attempt_gives_up_on_long_retry_after(monkeypatch):
+    monkeypatch.setattr(main, "OUTBOUND", main.OutboundScheduler({}, (100.0, 10, 2)))
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(429, headers={"Retry-After": str(main.RETRY_AFTER_MAX + 1)})
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main._attempt(client, "https://busy.test/page", main._read_text)
+
+    assert asyncio.run(go()) is None
+    assert len(calls) == 1
+
+
+def _hedger_with_threshold(url: str, seconds: float) -> main.Hedger:
+    hedger = main.Hedger()
+    for _ in range(main.HEDGE_MIN_SAMPLES):
+        hedger.observe(url, seconds)
+    hedger.credits = float(main.HEDGE_MAX_INFLIGHT)
+    return hedger
+
+
+def test_hedge_clock_starts_when_slot_is_granted(monkeypatch):
+    url = "https://hedge.test/page"
+    sched = main.OutboundScheduler({"hedge.test": (100.0, 10, 1)}, (1.0, 1, 1))
+    hedger = _hedger_with_threshold(url, 0.05)
+    monkeypatch.setattr(main, "OUTBOUND", sched)
+    monkeypatch.setattr(main, "HEDGER", hedger)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, text="ok")
+
+    async def go():
+        # хост занят дольше порога: ожидание в очереди не должно запускать дубль
+        busy = asyncio.create_task(_grab(sched, url, [], "busy", hold=0.3))
+        await asyncio.sleep(0.01)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            result = await main._get(client, url, main._read_text, hedge=True)
+        await busy
+        return result
+
+    assert asyncio.run(go()) == "ok"
+    assert len(calls) == 1
+    assert hedger.inflight == 0
+
+
+def test_hedge_fires_for_slow_response(monkeypatch):
+    url = "https://hedge.test/page"
+    monkeypatch.setattr(main, "OUTBOUND", main.OutboundScheduler({}, (100.0, 10, 4)))
+    hedger = _hedger_with_threshold(url, 0.05)
+    monkeypatch.setattr(main, "HEDGER", hedger)
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+        return httpx.Response(200, text=f"call {len(calls)}")
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await main._get(client, url, main._read_text, hedge=True)
+
+    started = time.monotonic()
+    assert asyncio.run(go()) == "call 2"
+    assert time.monotonic() - started < 0.5
+    assert hedger.inflight == 0
+
+
+def test_cancelled_get_cancels_its_attempt(monkeypatch):
+    url = "https://hedge.test/page"
+    sched = main.OutboundScheduler({}, (100.0, 10, 4))
+    monkeypatch.setattr(main, "OUTBOUND", sched)
+    monkeypatch.setattr(main, "HEDGER", _hedger_with_threshold(url, 5.0))
+
+    async def handler(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            task = asyncio.create_task(main._get(client, url, main._read_text, hedge=True))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await asyncio.sleep(0.01)
+            others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            return others, sched.hosts["hedge.test"].active
+
+    others, active = asyncio.run(go())
+    assert others == []
+    assert active == 0
+
+
+def test_hedge_hosts_start_with_configured_threshold():
+    hedger = main.Hedger()
+    host, start = next(iter(main.HEDGE_HOSTS.items()))
+    url = f"https://{host}/news"
+    assert hedger.threshold(url) == start  # после перезапуска замеров нет
+    assert hedger.threshold("https://other.test/") is None
+    for _ in range(main.HEDGE_MIN_SAMPLES):
+        hedger.observe(url, 0.2)
+    assert hedger.threshold(url) == 0.2  # дальше — свой p95
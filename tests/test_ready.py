@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _fill_all(items):
+    for topic in main.TOPICS:
+        main.cache_set(topic, list(items))
+        main.PIPELINE_STATS[topic] = {"ts": main.now_ts(), "items": len(items), "failed": []}
+
+
+def test_ready_when_every_topic_has_items(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    monkeypatch.setattr(main, "PIPELINE_STATS", {})
+    _fill_all([{"title": "x", "url": "https://e.test/x"}])
+    r = TestClient(main.app).get("/ready")
+    assert r.status_code == 200
+    assert r.json()["failed"] == []
+
+
+def test_failed_empty_topic_is_not_warm(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    monkeypatch.setattr(main, "PIPELINE_STATS", {})
+    _fill_all([{"title": "x", "url": "https://e.test/x"}])
+    main.cache_set("agro", [])
+    main.PIPELINE_STATS["agro"] = {"ts": main.now_ts(), "items": 0, "failed": ["site:https://mcx.gov.ru/"]}
+    r = TestClient(main.app).get("/ready")
+    assert r.status_code == 503
+    body = r.json()
+    assert body["failed"] == ["agro"]
+    assert body["topics"]["agro"]["warm"] is False
+    assert body["topics"]["agro"]["failed"] == ["site:https://mcx.gov.ru/"]
+
+
+def test_intentionally_empty_topic_is_warm_while_ttl_runs(monkeypatch):
+    monkeypatch.setattr(main, "CACHE", {})
+    monkeypatch.setattr(main, "PIPELINE_STATS", {})
+    _fill_all([{"title": "x", "url": "https://e.test/x"}])
+    main.cache_set("afisha", [])
+    assert main.topic_warm("afisha") == (True, [])
+    main.CACHE["afisha"]["ts"] -= main.CACHE["afisha"]["ttl"] + 1
+    assert main.topic_warm("afisha") == (False, [])
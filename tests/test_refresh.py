@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "CACHE", {})
+    monkeypatch.setattr(main, "INFLIGHT", {})
+    monkeypatch.setattr(main, "APPLIED_SEQ", {})
+    monkeypatch.setattr(main, "ARCHIVE", main.Archive(str(tmp_path / "archive.sqlite3")))
+
+
+def _pool(tag):
+    return [{"title": f"{tag} {i}", "summary": "", "url": f"https://e.test/{tag}/{i}", "image": ""} for i in range(3)]
+
+
+def test_force_during_prewarm_starts_its_own_refresh(monkeypatch):
+    monkeypatch.setattr(main, "TOPICS", {"ai": main.TOPICS["ai"]})
+    calls = []
+    background_may_finish = None
+
+    async def fake_collect(topic, force=False):
+        calls.append((force, main.FETCH_PRIORITY.get()))
+        if not force:
+            await background_may_finish.wait()
+            return _pool("background")
+        return _pool("forced")
+
+    monkeypatch.setattr(main, "collect_topic", fake_collect)
+
+    async def go():
+        nonlocal background_may_finish
+        background_may_finish = asyncio.Event()
+        warm = asyncio.create_task(main.prewarm())
+        await asyncio.sleep(0.01)
+        assert "ai" in main.INFLIGHT  # прогрев идёт
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            r = await asyncio.wait_for(client.get("/data", params={"topic": "ai", "force": 1}), timeout=2)
+        background_may_finish.set()
+        await warm
+        return r.json()
+
+    body = asyncio.run(go())
+    # force=1 не ждал прогрев и собрал тему сам — с приоритетом пользователя и в обход интервалов
+    assert calls == [(False, main.PRIORITY_BACKGROUND), (True, main.PRIORITY_USER)]
+    assert [it["title"] for it in body] == ["forced 0", "forced 1", "forced 2"]
+    # прогрев закончился позже, но его более старый результат не затёр свежий
+    assert main.CACHE["ai"]["items"][0]["title"] == "forced 0"
+    assert main.INFLIGHT == {}
+
+
+def test_plain_requests_share_one_refresh(monkeypatch):
+    calls = []
+
+    async def fake_collect(topic, force=False):
+        calls.append(force)
+        await asyncio.sleep(0.05)
+        return _pool("shared")
+
+    monkeypatch.setattr(main, "collect_topic", fake_collect)
+
+    async def go():
+        return await asyncio.gather(main.refresh_topic("ai"), main.refresh_topic("ai"), main.refresh_topic("ai"))
+
+    results = asyncio.run(go())
+    assert calls == [False]
+    assert len({version for version, _ in results}) == 1
+
+
+def test_forced_refresh_is_joined_by_later_calls(monkeypatch):
+    calls = []
+
+    async def fake_collect(topic, force=False):
+        calls.append(force)
+        await asyncio.sleep(0.05)
+        return _pool("forced")
+
+    monkeypatch.setattr(main, "collect_topic", fake_collect)
+
+    async def go():
+        return await asyncio.gather(main.refresh_topic("ai", force=True), main.refresh_topic("ai"),
+                                    main.refresh_topic("ai", force=True))
+
+    asyncio.run(go())
+    assert calls == [True]
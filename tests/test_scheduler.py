@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1_700_000_000}
+    monkeypatch.setattr(main, "now_ts", lambda: now["t"])
+    return now
+
+
+def test_unchanged_content_grows_interval_up_to_bound():
+    sched = main.RefreshScheduler()
+    lo, hi = main.TOPIC_TTL_BOUNDS["agro"]
+    start = main.TOPIC_TTL["agro"]
+    sched.observe_content("agro", "site:a", ["x"])
+    assert sched.source_interval("agro", "site:a") == start  # первое наблюдение — не с чем сравнить
+    sched.observe_content("agro", "site:a", ["x"])
+    assert sched.source_interval("agro", "site:a") == start * sched.GROW
+    for _ in range(20):
+        sched.observe_content("agro", "site:a", ["x"])
+    assert sched.source_interval("agro", "site:a") == hi
+
+
+def test_changed_content_shrinks_interval_down_to_bound():
+    sched = main.RefreshScheduler()
+    lo, _ = main.TOPIC_TTL_BOUNDS["agro"]
+    start = main.TOPIC_TTL["agro"]
+    sched.observe_content("agro", "site:a", ["v0"])
+    sched.observe_content("agro", "site:a", ["v1"])
+    assert sched.source_interval("agro", "site:a") == max(lo, start * sched.SHRINK)
+    for i in range(2, 20):
+        sched.observe_content("agro", "site:a", [f"v{i}"])
+    assert sched.source_interval("agro", "site:a") == lo
+
+
+def test_posts_rate_sets_interval(clock):
+    sched = main.RefreshScheduler()
+    # первый заход: 11 постов за 1100 с -> 1 пост в 110 с -> TARGET_NEW постов за 330 с
+    stamps = [clock["t"] - 1100 + 110 * i for i in range(11)]
+    sched.observe_posts("svo", "tg:a", stamps)
+    assert sched.source_interval("svo", "tg:a") == pytest.approx(sched.TARGET_NEW * 110)
+
+    # дальше — скользящее среднее: 0 новых постов за 600 с тянет частоту вниз
+    clock["t"] += 600
+    sched.observe_posts("svo", "tg:a", [])
+    rate = (1 - sched.ALPHA) / 110
+    assert sched.source_interval("svo", "tg:a") == pytest.approx(sched.TARGET_NEW / rate)
+
+
+def test_posts_rate_is_clamped(clock):
+    sched = main.RefreshScheduler()
+    lo, hi = main.TOPIC_TTL_BOUNDS["svo"]
+    sched.observe_posts("svo", "tg:busy", [clock["t"] - i for i in range(100)])  # пост в секунду
+    assert sched.source_interval("svo", "tg:busy") == lo
+    sched.observe_posts("svo", "tg:quiet", [clock["t"] - 10 * 86400, clock["t"]])
+    assert sched.source_interval("svo", "tg:quiet") == hi
+
+
+def test_topic_interval_is_fastest_source():
+    sched = main.RefreshScheduler()
+    assert sched.topic_interval("agro") == main.TOPIC_TTL["agro"]
+    sched._src("agro", "site:a")["interval"] = 5000
+    sched._src("agro", "tg:b")["interval"] = 2000
+    assert sched.topic_interval("agro") == 2000
+
+
+def _run_source(calls, src, force=False):
+    async def fetch(client, topic, source):
+        calls.append(source.name)
+        return [main._card(f"{source.target} новость", "", f"https://e.test/{len(calls)}", "", source)]
+
+    async def go():
+        return await main._run_source(None, "agro", src, {}, force)
+
+    main.SOURCE_FETCHERS[src.kind] = fetch
+    return asyncio.run(go())
+
+
+def test_run_source_reuses_result_until_own_interval(monkeypatch, clock):
+    sched = main.RefreshScheduler()
+    monkeypatch.setattr(main, "SCHEDULER", sched)
+    monkeypatch.setattr(main, "SOURCE_RESULTS", {})
+    monkeypatch.setitem(main.SOURCE_FETCHERS, "site", main.SOURCE_FETCHERS["site"])
+    src = main.Source("site", "https://slow.test/")
+    sched._src("agro", src.name)["interval"] = 3600
+    calls: list = []
+
+    first = _run_source(calls, src)
+    clock["t"] += 3599
+    again = _run_source(calls, src)
+    assert calls == [src.name]
+    assert again == first and again[0] is not first[0]  # копии: пайплайн правит карточки на месте
+
+    clock["t"] += 2
+    fresh = _run_source(calls, src)
+    assert calls == [src.name, src.name]
+    assert fresh[0]["url"] == "https://e.test/2"
+
+
+def test_run_source_force_refetches(monkeypatch, clock):
+    sched = main.RefreshScheduler()
+    monkeypatch.setattr(main, "SCHEDULER", sched)
+    monkeypatch.setattr(main, "SOURCE_RESULTS", {})
+    monkeypatch.setitem(main.SOURCE_FETCHERS, "site", main.SOURCE_FETCHERS["site"])
+    src = main.Source("site", "https://slow.test/")
+    calls: list = []
+    _run_source(calls, src)
+    _run_source(calls, src, force=True)
+    assert calls == [src.name, src.name]
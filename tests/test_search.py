@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+# Эталонные основы Snowball (Russian)
+@pytest.mark.parametrize("word, stem", [
+    ("новости", "новост"),
+    ("модели", "модел"),
+    ("выставка", "выставк"),
+    ("рынок", "рынок"),
+    ("рынка", "рынк"),
+    ("урожай", "урожа"),
+    ("урожая", "урож"),
+    ("красивая", "красив"),
+    ("книгами", "книг"),
+    ("делать", "дела"),
+    ("инвестиции", "инвестиц"),
+    ("подорожание", "подорожан"),
+    ("сельскохозяйственных", "сельскохозяйствен"),
+    ("ёлка", "елк"),
+])
+def test_stem_ru(word, stem):
+    assert main.stem_ru(word) == stem
+
+
+# Формы одного слова в индексе и в запросе должны сходиться в один терм
+@pytest.mark.parametrize("forms", [
+    ("урожай", "урожая", "урожаю", "урожаем", "урожае"),
+    ("новости", "новостей", "новость", "новостям"),
+    ("модель", "модели", "моделей", "моделями"),
+    ("выставка", "выставки", "выставке", "выставку"),
+    ("нейросеть", "нейросети", "нейросетей"),
+    ("подорожал", "подорожала", "подорожали"),
+])
+def test_stem_text_collapses_forms(forms):
+    stems = {tuple(main.stem_text(w)) for w in forms}
+    assert len(stems) == 1, stems
+
+
+def test_stem_text_keeps_latin_and_digits():
+    assert main.stem_text("OpenAI выпустила GPT-5") == ["openai", "выпуст", "gpt", "5"]
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    arch = main.Archive(str(tmp_path / "archive.sqlite3"))
+    monkeypatch.setattr(main, "ARCHIVE", arch)
+    arch.add("agro", [
+        {"title": "Рекордный урожай пшеницы в Ростовской области", "summary": "", "url": "https://a.test/1"},
+        {"title": "Экспорт зерна вырос", "summary": "Урожаем доволен Минсельхоз", "url": "https://a.test/2"},
+    ])
+    arch.add("ai", [
+        {"title": "Новые модели нейросетей", "summary": "", "url": "https://b.test/1"},
+    ])
+    asyncio.run(arch.flush())
+    return arch
+
+
+def test_search_round_trip_finds_inflected_query(archive):
+    client = TestClient(main.app)
+    titles = [it["title"] for it in client.get("/search", params={"q": "урожая"}).json()]
+    # совпадение в заголовке весит больше, чем в описании
+    assert titles == [
+        "Рекордный урожай пшеницы в Ростовской области",
+        "Экспорт зерна вырос",
+    ]
+    hits = client.get("/search", params={"q": "нейросеть модель"}).json()
+    assert [it["title"] for it in hits] == ["Новые модели нейросетей"]
+
+
+def test_search_filters_by_topic(archive):
+    client = TestClient(main.app)
+    assert client.get("/search", params={"q": "урожай", "topic": "ai"}).json() == []
+    assert len(client.get("/search", params={"q": "урожай", "topic": "agro"}).json()) == 2
+
+
+def test_archive_dedupes_by_url(archive):
+    archive.add("agro", [{"title": "Рекордный урожай (обновлено)", "url": "https://a.test/1?utm_source=tg"}])
+    assert archive.pending == []
@@ -0,0 +1,43 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_versioned_static_is_immutable():
+    client = TestClient(main.app)
+    url = main.STATIC.url("manifest.webmanifest")
+    r = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["cache-control"] == main.STATIC_IMMUTABLE
+    assert r.headers["content-encoding"] == "gzip"
+    assert client.get("/static/manifest.webmanifest").headers["cache-control"] == main.STATIC_REVALIDATE
+
+
+def test_service_worker_served_from_root():
+    client = TestClient(main.app)
+    r = client.get("/sw.js")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/javascript")
+    assert r.headers["cache-control"] == main.STATIC_REVALIDATE
+    assert "register('/sw.js'" in client.get("/").text
+
+
+def test_index_revalidates_by_etag():
+    client = TestClient(main.app)
+    r = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    again = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": r.headers["etag"]})
+    assert again.status_code == 304
+
+
+def test_static_index_holds_only_served_assets():
+    assert not any(path.startswith(("icon.", "icon-", "static/")) for path in main.STATIC.files)
+    assert "icons/apple-touch-icon.png" in main.STATIC.files
+
+
+def test_brotli_preferred_when_accepted():
+    rec = main.index_page()
+    assert "br" in rec  # brotli в requirements.txt
+    r = TestClient(main.app).get("/", headers={"Accept-Encoding": "gzip, br"})
+    assert r.headers["content-encoding"] == "br"
+    assert r.headers["vary"] == "Accept-Encoding"
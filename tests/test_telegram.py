@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+import main
+
+CHANNEL = "chan"
+
+
+@pytest.fixture(autouse=True)
+def clean_state(monkeypatch):
+    monkeypatch.setattr(main, "TG_STATE", {})
+    monkeypatch.setattr(main, "OUTBOUND", main.OutboundScheduler({}, (100.0, 10, 4)))
+
+
+def _page(ids, ts_of) -> str:
+    posts = "".join(
+        f'<div class="tgme_widget_message_wrap">'
+        f'<div class="tgme_widget_message" data-post="{CHANNEL}/{i}">'
+        f'<div class="tgme_widget_message_text">Пост {i}</div>'
+        f'<time datetime="{datetime.fromtimestamp(ts_of(i), timezone.utc).isoformat()}"></time>'
+        f"</div></div>"
+        for i in ids
+    )
+    return f"<html><body>{posts}</body></html>"
+
+
+class FakeChannel:
+    """t.me/s/<ch>: голова — последние head_size постов; ?after=N — до page_size постов после N."""
+
+    def __init__(self, last_id, ts_of, page_size=20, head_size=20):
+        self.last_id = last_id
+        self.ts_of = ts_of
+        self.page_size = page_size
+        self.head_size = head_size
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(str(request.url))
+        after = request.url.params.get("after")
+        if after is None:
+            ids = range(max(1, self.last_id - self.head_size + 1), self.last_id + 1)
+        else:
+            start = int(after) + 1
+            ids = range(start, min(self.last_id, start + self.page_size - 1) + 1)
+        return httpx.Response(200, text=_page(ids, self.ts_of))
+
+
+def _refresh(channel: FakeChannel, max_age=3600):
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(channel)) as client:
+            return await main.refresh_tg_channel(client, CHANNEL, max_age)
+
+    return asyncio.run(go())
+
+
+def _ids(items):
+    return [it["id"] for it in items]
+
+
+def recent(i):
+    return main.now_ts() - 60
+
+
+def test_first_load_takes_head_page():
+    chan = FakeChannel(100, recent)
+    fresh = _refresh(chan)
+    assert chan.requests == [f"https://t.me/s/{CHANNEL}"]
+    assert _ids(fresh) == list(range(81, 101))
+    assert main.tg_state(CHANNEL)["last_id"] == 100
+    assert _ids(main.tg_recent(CHANNEL, 3)) == [100, 99, 98]
+    assert fresh[0]["url"] == f"https://t.me/{CHANNEL}/81"
+
+
+def test_incremental_after_page():
+    chan = FakeChannel(100, recent)
+    _refresh(chan)
+    chan.last_id = 103
+    chan.requests.clear()
+    fresh = _refresh(chan)
+    assert chan.requests == [f"https://t.me/s/{CHANNEL}?after=100"]
+    assert _ids(fresh) == [101, 102, 103]
+    assert main.tg_state(CHANNEL)["last_id"] == 103
+
+
+def test_no_new_posts_keeps_cursor():
+    chan = FakeChannel(100, recent)
+    _refresh(chan)
+    chan.requests.clear()
+    assert _refresh(chan) == []
+    assert len(chan.requests) == 1
+    assert main.tg_state(CHANNEL)["last_id"] == 100
+
+
+def test_full_after_page_catches_up_from_head():
+    chan = FakeChannel(100, recent)
+    _refresh(chan)
+    chan.last_id = 400  # за ночь вышло 300 постов
+    chan.requests.clear()
+    fresh = _refresh(chan)
+    assert chan.requests == [f"https://t.me/s/{CHANNEL}?after=100", f"https://t.me/s/{CHANNEL}"]
+    assert main.tg_state(CHANNEL)["last_id"] == 400
+    assert _ids(main.tg_recent(CHANNEL, 1)) == [400]
+    assert _ids(fresh) == list(range(101, 121)) + list(range(381, 401))
+
+
+def test_stale_after_page_catches_up_from_head():
+    now = main.now_ts()
+    chan = FakeChannel(100, lambda i: now - 10 * 3600 if i <= 105 else now - 60)
+    _refresh(chan)
+    chan.last_id = 110
+    chan.page_size = 5  # страница неполная, но её посты старше интервала
+    chan.requests.clear()
+    _refresh(chan, max_age=3600)
+    assert chan.requests[-1] == f"https://t.me/s/{CHANNEL}"
+    assert main.tg_state(CHANNEL)["last_id"] == 110
+
+
+def test_overlapping_pages_are_deduped_by_id():
+    chan = FakeChannel(100, recent)
+    _refresh(chan)
+    chan.last_id = 115
+    chan.page_size = 20
+    chan.head_size = 40  # голова перекрывает и after-страницу, и уже виденные посты
+    fresh = _refresh(chan, max_age=3600)
+    ids = _ids(main.tg_state(CHANNEL)["items"])
+    assert ids == sorted(set(ids))
+    assert _ids(fresh) == list(range(101, 116))
+
+
+def test_ring_evicts_oldest_posts(monkeypatch):
+    chan = FakeChannel(20, recent)
+    _refresh(chan)
+    for last in range(40, 120, 15):
+        chan.last_id = last
+        _refresh(chan)
+    ring = _ids(main.tg_state(CHANNEL)["items"])
+    assert len(ring) == main.TG_RING_SIZE
+    assert ring == list(range(chan.last_id - main.TG_RING_SIZE + 1, chan.last_id + 1))
+
+
+def test_failed_fetch_leaves_ring_untouched():
+    chan = FakeChannel(100, recent)
+    _refresh(chan)
+
+    def down(request):
+        return httpx.Response(500)
+
+    async def go():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(down)) as client:
+            return await main.refresh_tg_channel(client, CHANNEL)
+
+    assert asyncio.run(go()) is None
+    assert main.tg_state(CHANNEL)["last_id"] == 100
+    assert len(main.tg_state(CHANNEL)["items"]) == 20